@@ -0,0 +1,77 @@
+"""Замер времени запуска dff: бюджет импорта и холодный старт CLI
+
+Запуск: python bench_startup.py [количество повторов]
+Код возврата 1, если бюджет импорта превышен или при импорте загружены
+модули, которые должны подгружаться только в отдельных режимах.
+"""
+import os
+import py_compile
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+IMPORT_BUDGET_MS = 25.0  # Медиана совокупного времени импорта dff
+LAZY_MODULES = ("argparse", "json", "mmap", "random", "shutil", "struct")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import(runs: int) -> float:
+    """Возвращает медиану совокупного времени импорта dff по данным -X importtime, мс"""
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import dff"],
+                                cwd=ROOT, capture_output=True, text=True, check=True)
+        for line in result.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == "dff":
+                timings.append(int(parts[1]) / 1000)
+    return statistics.median(timings)
+
+
+def loaded_lazy_modules() -> list:
+    """Возвращает модули из LAZY_MODULES, загруженные простым импортом dff"""
+    code = f"import sys, dff; print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+def measure_cold_start(runs: int) -> float:
+    """Возвращает медиану времени полного запуска CLI на маленьком дереве, мс"""
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(20):
+            with open(os.path.join(directory, f"file_{i}.txt"), "w") as f:
+                f.write(str(i % 5) * 100)
+
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(ROOT, "dff.py"), "scan", directory],
+                           capture_output=True, check=True)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    # Компилируем байт-код заранее, чтобы не учитывать компиляцию
+    # (подпроцесс может не записать его сам, например при PYTHONDONTWRITEBYTECODE)
+    py_compile.compile(os.path.join(ROOT, "dff.py"))
+
+    import_ms = measure_import(runs)
+    lazy_loaded = loaded_lazy_modules()
+    cold_start_ms = measure_cold_start(runs)
+
+    print(f"Импорт dff: {import_ms:.1f} мс (бюджет {IMPORT_BUDGET_MS:.1f} мс)")
+    print(f"Холодный старт CLI: {cold_start_ms:.1f} мс")
+    if lazy_loaded:
+        print(f"При импорте загружены отложенные модули: {', '.join(lazy_loaded)}")
+
+    return 1 if import_ms > IMPORT_BUDGET_MS or lazy_loaded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
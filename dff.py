@@ -1,8 +1,11 @@
+# Модули, нужные только отдельным режимам (argparse, json, mmap, random, shutil,
+# struct), импортируются при первом использовании, чтобы не замедлять запуск
 import hashlib
 import os
 import sys
 import time
-from typing import Dict, List, Callable, Optional
+from collections import deque
+from typing import Dict, List, Callable, Iterable, Optional
 
 
 class DuplicateFileFinderConfig:
@@ -12,11 +15,36 @@ class DuplicateFileFinderConfig:
         # Флаги конфигурации
         self.verbose_output = False
         self.output_immediately = False
+        self.find_similar = False  # Поиск похожих (почти одинаковых) файлов
+        self.similarity_threshold = 0.5  # Минимальная доля общих фрагментов
+        self.trash_directory = os.path.join(os.path.expanduser("~"), ".dff_trash")
+        self.keep_file_metadata = False  # Сохранять метаданные файлов для экспорта
+        self.find_duplicate_directories = False  # Искать одинаковые поддеревья директорий
+        self.time_limit: Optional[float] = None  # Ограничение времени хеширования, секунды
+
+        # Ограничение нагрузки на диск
+        self.io_max_bytes_per_second: Optional[int] = None
+        self.io_max_ops_per_second: Optional[int] = None
+        self.io_low_priority = False  # Понизить приоритет процесса (nice/ioprio)
+        self.io_latency_backoff = False  # Снижать скорость при росте задержки чтения
+        self.io_latency_factor = 2.0  # Во сколько раз задержка должна превысить базовую
+        self.io_min_bytes_per_second = 1048576  # Нижняя граница скорости при снижении
+        self.byte_budget: Optional[int] = None  # Ограничение объёма чтения, байты
 
         # Константы
         self.BYTES_IN_A_MEGABYTE = 1048576
         self.BYTES_TO_SCAN = 4096  # Размер блока для чтения файла
         self.SCAN_SIZE_MB = self.BYTES_TO_SCAN / self.BYTES_IN_A_MEGABYTE
+        self.SMALL_FILES_BATCH = 1024  # Файлов до BYTES_TO_SCAN, хешируемых за один проход
+        self.OUTPUT_BUFFER_LIMIT = 1048576  # Сколько последних символов вывода хранить
+
+        # Параметры разбиения на фрагменты переменной длины
+        self.CHUNK_MIN_SIZE = 2048
+        self.CHUNK_AVG_SIZE = 8192  # Должен быть степенью двойки
+        self.CHUNK_MAX_SIZE = 65536
+        self.MINHASH_PERMUTATIONS = 64
+        self.LSH_BANDS = 16
+        self.LSH_MAX_BUCKET_SIZE = 256  # Более крупные корзины LSH не дают пар-кандидатов
 
 
 class FileIgnoreList:
@@ -69,6 +97,8 @@ class ProgressTracker:
         self.files_scanned = 0
         self.total_files = 0
         self.duples_found = 0
+        self.read_operations = 0
+        self.start_time = time.monotonic()
         self.progress_callback: Optional[Callable[[str, bool, object], None]] = None
 
     def reset(self):
@@ -77,6 +107,8 @@ class ProgressTracker:
         self.files_scanned = 0
         self.total_files = 0
         self.duples_found = 0
+        self.read_operations = 0
+        self.start_time = time.monotonic()
 
     def set_progress_callback(self, callback: Callable[[str, bool], None]):
         """Устанавливает функцию обратного вызова для отображения прогресса"""
@@ -103,6 +135,421 @@ class ProgressTracker:
         """Увеличивает количество просканированных файлов"""
         self.files_scanned += 1
 
+    def inc_read_operations(self):
+        """Увеличивает количество операций чтения"""
+        self.read_operations += 1
+
+    def throughput(self) -> tuple:
+        """Возвращает среднюю скорость с начала сканирования: (байт/с, операций/с)"""
+        elapsed = max(time.monotonic() - self.start_time, 1e-6)
+        return self.megabytes_scanned * 1024 * 1024 / elapsed, self.read_operations / elapsed
+
+
+class ContentChunker:
+    """Класс разбиения потока данных на фрагменты по содержимому
+
+    Каждый байт отображается в бит по псевдослучайной таблице, граница фрагмента
+    ставится после первой серии из BOUNDARY_RUN единичных бит. Отображение
+    (bytes.translate) и поиск серии (find) выполняются в C, поэтому разбиение
+    не требует цикла Python по байтам и устойчиво к вставкам и сдвигам данных.
+    """
+
+    _BIT_TABLE = b""
+
+    def __init__(self, config: DuplicateFileFinderConfig):
+        if not ContentChunker._BIT_TABLE:
+            import random
+            # Ровно половина значений байта даёт единицу
+            bits = list(b"0" * 128 + b"1" * 128)
+            random.Random(0).shuffle(bits)
+            ContentChunker._BIT_TABLE = bytes(bits)
+        self.min_size = config.CHUNK_MIN_SIZE
+        self.max_size = config.CHUNK_MAX_SIZE
+        # Серия из k единиц встречается в среднем раз в 2 ** (k + 1) байт
+        self.boundary_run = b"1" * (config.CHUNK_AVG_SIZE.bit_length() - 2)
+        self.chunks: Dict[int, int] = {}  # отпечаток фрагмента -> длина
+        self._pending = bytearray()
+        self._pending_bits = bytearray()
+
+    def update(self, data: bytes):
+        """
+        Добавляет очередной блок данных и выделяет завершённые фрагменты
+
+        Args:
+            data: Прочитанный блок файла
+        """
+        self._pending += data
+        self._pending_bits += data.translate(self._BIT_TABLE)
+        while len(self._pending) >= self.max_size:
+            self._emit(self._find_boundary())
+
+    def finish(self) -> Dict[int, int]:
+        """
+        Завершает разбиение
+
+        Returns:
+            Словарь отпечаток фрагмента -> длина фрагмента
+        """
+        while self._pending:
+            self._emit(self._find_boundary() if len(self._pending) > self.min_size else len(self._pending))
+        return self.chunks
+
+    def _find_boundary(self) -> int:
+        """Ищет границу фрагмента в начале накопленных данных"""
+        end = min(len(self._pending), self.max_size)
+        # Первые min_size байт не могут содержать границу — пропускаем их
+        position = self._pending_bits.find(self.boundary_run, self.min_size, end)
+        if position < 0:
+            return end
+        return position + len(self.boundary_run)
+
+    def _emit(self, length: int):
+        chunk = bytes(self._pending[:length])
+        del self._pending[:length]
+        del self._pending_bits[:length]
+        fingerprint = int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little")
+        self.chunks[fingerprint] = length
+
+
+class SimilarityIndex:
+    """Класс индекса похожих файлов на основе MinHash и LSH
+
+    Файлы с одинаковым полным хешем индексируются один раз: точные дубликаты
+    уже найдены, а их одинаковые сигнатуры попали бы в одни и те же корзины.
+    """
+
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, config: DuplicateFileFinderConfig):
+        import random
+
+        self.config = config
+        rng = random.Random(config.MINHASH_PERMUTATIONS)
+        self._permutations = [(rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME))
+                              for _ in range(config.MINHASH_PERMUTATIONS)]
+        self.file_chunks: Dict[str, Dict[int, int]] = {}  # представитель содержимого -> фрагменты
+        self.file_hashes: Dict[str, str] = {}  # каждый добавленный файл -> полный хеш
+        self.copies: Dict[str, int] = {}  # полный хеш -> количество файлов с ним
+        self.buckets: Dict[tuple, List[str]] = {}  # (полоса, значения) -> файлы
+
+    def add(self, file_path: str, full_hash: str, chunks: Dict[int, int]):
+        """
+        Добавляет файл в индекс
+
+        Args:
+            file_path: Путь к файлу
+            full_hash: Полный хеш файла
+            chunks: Отпечатки фрагментов файла и их длины
+        """
+        if not chunks or file_path in self.file_hashes:
+            return
+        self.file_hashes[file_path] = full_hash
+        self.copies[full_hash] = self.copies.get(full_hash, 0) + 1
+        if self.copies[full_hash] > 1:
+            return
+        self.file_chunks[file_path] = chunks
+
+        signature = self._minhash(chunks)
+        rows = len(signature) // self.config.LSH_BANDS
+        for band in range(self.config.LSH_BANDS):
+            key = (band, tuple(signature[band * rows:(band + 1) * rows]))
+            self.buckets.setdefault(key, []).append(file_path)
+
+    def _minhash(self, chunks: Dict[int, int]) -> List[int]:
+        prime = self._PRIME
+        return [min((a * fingerprint + b) % prime for fingerprint in chunks)
+                for a, b in self._permutations]
+
+    def similarity(self, file_1: str, file_2: str) -> float:
+        """
+        Вычисляет долю общих байт двух файлов по фрагментам
+
+        Args:
+            file_1: Путь к первому файлу
+            file_2: Путь ко второму файлу
+
+        Returns:
+            Взвешенный по длине коэффициент Жаккара от 0 до 1
+        """
+        chunks_1 = self.file_chunks[file_1]
+        chunks_2 = self.file_chunks[file_2]
+        common = sum(chunks_1[fp] for fp in chunks_1.keys() & chunks_2.keys())
+        total = sum(chunks_1.values()) + sum(chunks_2.values()) - common
+        return common / total if total else 0.0
+
+    def find_similar_pairs(self, threshold: float) -> List[tuple]:
+        """
+        Ищет пары похожих, но не идентичных файлов
+
+        Args:
+            threshold: Минимальная степень похожести
+
+        Returns:
+            Список (файл, файл, похожесть), отсортированный по убыванию похожести
+        """
+        candidates = set()
+        for files in self.buckets.values():
+            # Переполненная корзина (например, общий заголовок у множества файлов)
+            # дала бы квадратичное число кандидатов
+            if len(files) > self.config.LSH_MAX_BUCKET_SIZE:
+                continue
+            for i, file_1 in enumerate(files):
+                for file_2 in files[i + 1:]:
+                    candidates.add((file_1, file_2))
+
+        similar_pairs = []
+        for file_1, file_2 in candidates:
+            similarity = self.similarity(file_1, file_2)
+            if similarity >= threshold:
+                similar_pairs.append((file_1, file_2, similarity))
+
+        similar_pairs.sort(key=lambda pair: (-pair[2], pair[0], pair[1]))
+        return similar_pairs
+
+    def estimate_dedup_savings(self) -> int:
+        """
+        Оценивает объём, освобождаемый блочной дедупликацией
+
+        Returns:
+            Количество байт в повторяющихся фрагментах
+        """
+        total_bytes = 0
+        unique_chunks: Dict[int, int] = {}
+        for file_path, chunks in self.file_chunks.items():
+            total_bytes += sum(chunks.values()) * self.copies[self.file_hashes[file_path]]
+            unique_chunks.update(chunks)
+        return total_bytes - sum(unique_chunks.values())
+
+
+class IoGovernor:
+    """Класс ограничения нагрузки на диск при чтении файлов
+
+    Ограничивает скорость чтения (байт/с) и количество операций чтения в
+    секунду по счётчикам ProgressTracker, при необходимости понижает приоритет
+    процесса и снижает скорость, если задержка чтения растёт.
+    """
+
+    WINDOW_SECONDS = 1.0  # Длина окна, по которому считается скорость
+    LATENCY_SMOOTHING = 0.2  # Коэффициент экспоненциального сглаживания задержки
+    MIN_BACKOFF_LATENCY = 0.0005  # Меньшие задержки (чтение из кеша) не считаются нагрузкой
+    ADJUST_INTERVAL = 1.0  # Не чаще раза в столько секунд скорость снижается или восстанавливается
+    RECOVERY_FACTOR = 1.25  # Во сколько раз восстанавливается скорость за интервал
+
+    _priority_lowered = False  # Приоритет понижается один раз на процесс
+
+    def __init__(self, config: DuplicateFileFinderConfig, progress: ProgressTracker):
+        self.config = config
+        self.progress = progress
+        self.bytes_per_second = config.io_max_bytes_per_second
+        self.ops_per_second = config.io_max_ops_per_second
+        self.latency = None  # Сглаженная задержка чтения, секунды
+        self.base_latency = None  # Наименьшая сглаженная задержка до появления нагрузки
+        self._recovery_limit = None  # Скорость, до которой восстанавливаться без заданного ограничения
+        self._last_adjust = None
+        self._start_window()
+
+    @staticmethod
+    def is_enabled(config: DuplicateFileFinderConfig) -> bool:
+        """Нужен ли governor для данной конфигурации"""
+        return bool(config.io_max_bytes_per_second or config.io_max_ops_per_second
+                    or config.io_low_priority or config.io_latency_backoff)
+
+    def lower_priority(self):
+        """Понижает приоритет процесса для процессора и диска, если он ещё не понижен"""
+        if IoGovernor._priority_lowered:
+            return
+        IoGovernor._priority_lowered = True
+        try:
+            if sys.platform == "win32":
+                import ctypes
+                process_mode_background_begin = 0x00100000
+                kernel32 = ctypes.windll.kernel32
+                kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), process_mode_background_begin)
+                return
+
+            os.nice(10)
+            if sys.platform.startswith("linux"):
+                import ctypes
+                import platform
+                # Номер системного вызова ioprio_set зависит от архитектуры
+                syscall = {"x86_64": 251, "aarch64": 30, "i686": 289}.get(platform.machine())
+                if syscall:
+                    ioprio_class_idle = 3
+                    ioprio_who_process = 1
+                    libc = ctypes.CDLL(None, use_errno=True)
+                    libc.syscall(syscall, ioprio_who_process, 0, ioprio_class_idle << 13)
+        except (OSError, AttributeError) as e:
+            self.progress.show_progress(f"Не удалось понизить приоритет процесса: {e}", True)
+
+    def read(self, f, size: int) -> bytes:
+        """
+        Читает блок файла с учётом ограничений
+
+        Args:
+            f: Открытый файл или его дескриптор
+            size: Размер блока
+
+        Returns:
+            Прочитанные данные
+        """
+        start = time.monotonic()
+        data = os.read(f, size) if isinstance(f, int) else f.read(size)
+        self.progress.inc_read_operations()
+
+        if self.config.io_latency_backoff:
+            self._observe_latency(time.monotonic() - start)
+        self._throttle()
+        return data
+
+    def _start_window(self):
+        self._window_time = time.monotonic()
+        self._window_bytes = self.progress.megabytes_scanned * self.config.BYTES_IN_A_MEGABYTE
+        self._window_ops = self.progress.read_operations
+
+    def _throttle(self):
+        """Делает паузу, если скорость в текущем окне превышает ограничения"""
+        now = time.monotonic()
+        elapsed = now - self._window_time
+        delay = 0.0
+        if self.bytes_per_second:
+            window_bytes = self.progress.megabytes_scanned * self.config.BYTES_IN_A_MEGABYTE - self._window_bytes
+            delay = max(delay, window_bytes / self.bytes_per_second - elapsed)
+        if self.ops_per_second:
+            window_ops = self.progress.read_operations - self._window_ops
+            delay = max(delay, window_ops / self.ops_per_second - elapsed)
+        if delay > 0:
+            time.sleep(delay)
+        if elapsed + delay >= self.WINDOW_SECONDS:
+            self._start_window()
+
+    def _observe_latency(self, latency: float):
+        """
+        Обновляет сглаженную задержку и снижает или восстанавливает скорость
+
+        Пока задержка выше базовой в io_latency_factor раз, скорость снижается
+        вдвое раз в ADJUST_INTERVAL; когда задержка возвращается к базовой,
+        скорость раз в интервал растёт в RECOVERY_FACTOR раз до исходной.
+        Базовая задержка обновляется только при отсутствии нагрузки.
+        """
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.LATENCY_SMOOTHING * (latency - self.latency)
+        if self.base_latency is None:
+            self.base_latency = self.latency
+
+        now = time.monotonic()
+        can_adjust = self._last_adjust is None or now - self._last_adjust >= self.ADJUST_INTERVAL
+        if self.latency > max(self.base_latency * self.config.io_latency_factor, self.MIN_BACKOFF_LATENCY):
+            if not can_adjust or self.bytes_per_second == self.config.io_min_bytes_per_second:
+                return
+            current = self.bytes_per_second or self.progress.throughput()[0]
+            if self._recovery_limit is None:
+                self._recovery_limit = self.config.io_max_bytes_per_second or current
+            self.bytes_per_second = max(int(current / 2), self.config.io_min_bytes_per_second)
+            self._last_adjust = now
+            self.progress.show_progress(
+                f"Задержка чтения выросла, скорость снижена до "
+                f"{self.bytes_per_second / self.config.BYTES_IN_A_MEGABYTE:.2f} мб/с", True
+            )
+            self._start_window()
+            return
+
+        self.base_latency = min(self.base_latency, self.latency)
+        if self._recovery_limit is not None and can_adjust:
+            # Восстанавливаем скорость по времени, а не по количеству чтений
+            recovered = int(self.bytes_per_second * self.RECOVERY_FACTOR)
+            if recovered >= self._recovery_limit:
+                # Исходная скорость достигнута; без заданного ограничения оно снимается
+                self.bytes_per_second = self.config.io_max_bytes_per_second
+                self._recovery_limit = None
+            else:
+                self.bytes_per_second = recovered
+            self._last_adjust = now
+
+
+class DigestCache:
+    """Класс общего кеша хешей файлов для повторных сканирований
+
+    Кеш потокобезопасен и может использоваться несколькими сеансами
+    одновременно. Ключ включает размер, время изменения и inode файла, поэтому
+    изменённый файл хешируется заново. При превышении объёма памяти
+    вытесняются давно не использованные записи.
+    """
+
+    ENTRY_OVERHEAD = 200  # Примерные накладные расходы словаря и кортежа на запись, байт
+
+    def __init__(self, max_bytes: int = 64 * 1048576):
+        import threading
+        from collections import OrderedDict
+
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(kind: str, file_path: str, file_stat: tuple) -> tuple:
+        """
+        Формирует ключ кеша
+
+        Args:
+            kind: Вид хеша ("snippet" или "full")
+            file_path: Путь к файлу
+            file_stat: (размер, mtime_ns, inode) файла, полученные при сканировании
+
+        Returns:
+            Ключ записи
+        """
+        return (kind, file_path) + tuple(file_stat)
+
+    def _entry_size(self, key: tuple, digest: str) -> int:
+        return sys.getsizeof(key[1]) + sys.getsizeof(digest) + self.ENTRY_OVERHEAD
+
+    def get(self, key: tuple) -> Optional[str]:
+        """Возвращает хеш из кеша или None"""
+        with self._lock:
+            digest = self._entries.get(key)
+            if digest is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return digest
+
+    def put(self, key: tuple, digest: str):
+        """Добавляет хеш в кеш, вытесняя старые записи при нехватке памяти"""
+        entry_size = self._entry_size(key, digest)
+        if entry_size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = digest
+            self.used_bytes += entry_size
+            while self.used_bytes > self.max_bytes:
+                old_key, old_digest = self._entries.popitem(last=False)
+                self.used_bytes -= self._entry_size(old_key, old_digest)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ScanBudgetExhausted(Exception):
+    """Исключение остановки хеширования по бюджету времени или объёма чтения
+
+    Args:
+        file_path: Файл, на котором остановлено хеширование
+        digests: Хеши, вычисленные в пакете до остановки
+    """
+
+    def __init__(self, file_path: str, digests: Optional[Dict[str, str]] = None):
+        super().__init__(file_path)
+        self.digests = digests or {}
+
 
 class FileHashCalculator:
     """Класс для вычисления хешей файлов"""
@@ -111,6 +558,36 @@ class FileHashCalculator:
         self.config = config
         self.progress = progress
         self.full_hashes: Dict[str, str] = {}
+        self.file_digests: Dict[str, str] = {}  # файл -> полный хеш, если сохраняются метаданные
+        self.similarity_index: Optional[SimilarityIndex] = None
+        self.governor: Optional[IoGovernor] = None
+        self.digest_cache: Optional[DigestCache] = None
+        self.file_stats: Dict[str, tuple] = {}  # файл -> (размер, mtime_ns, inode) из сканирования
+        self.budget_check: Optional[Callable[[], bool]] = None  # True, если бюджет исчерпан
+
+    def _cache_key(self, kind: str, file_path: str) -> Optional[tuple]:
+        """
+        Возвращает ключ общего кеша хешей
+
+        Используются данные stat, собранные при сканировании, поэтому
+        дополнительного обращения к файловой системе нет.
+
+        Returns:
+            Ключ или None, если кеш не используется или данных о файле нет
+        """
+        if self.digest_cache is None or file_path not in self.file_stats:
+            return None
+        return DigestCache.make_key(kind, file_path, self.file_stats[file_path])
+
+    def _read(self, f, size: int) -> bytes:
+        """Читает блок файла через governor, если он задан"""
+        if self.governor:
+            return self.governor.read(f, size)
+        return f.read(size)
+
+    def _keep_digests(self) -> bool:
+        """Нужно ли запоминать полный хеш каждого файла"""
+        return self.config.keep_file_metadata or self.config.find_duplicate_directories
 
     def calculate_snippet_hash(self, file_path: str) -> str:
         """
@@ -124,13 +601,24 @@ class FileHashCalculator:
         """
         self.progress.show_progress(f"...вычисление хеша фрагмента файла {file_path}", True)
 
+        cache_key = self._cache_key("snippet", file_path)
+        if cache_key:
+            cached_hash = self.digest_cache.get(cache_key)
+            if cached_hash:
+                return cached_hash
+
         try:
             snip_hash = hashlib.blake2b()
             with open(file_path, "rb") as f:
-                chunk = f.read(self.config.BYTES_TO_SCAN)
+                chunk = self._read(f, self.config.BYTES_TO_SCAN)
                 if chunk:
                     snip_hash.update(chunk)
                     self.progress.add_scanned_bytes(len(chunk))
+                if self._keep_digests() and len(chunk) < self.config.BYTES_TO_SCAN:
+                    # Файл прочитан целиком, хеш фрагмента совпадает с полным хешем
+                    self.file_digests[file_path] = snip_hash.hexdigest()
+                if cache_key:
+                    self.digest_cache.put(cache_key, snip_hash.hexdigest())
                 return snip_hash.hexdigest()
         except PermissionError:
             error_msg = f"Ошибка доступа: {file_path}"
@@ -153,21 +641,101 @@ class FileHashCalculator:
         """
         self.progress.show_progress(f"...вычисление полного хеша файла {file_path}", True)
 
+        # При поиске похожих файлов содержимое нужно прочитать ради фрагментов
+        cache_key = self._cache_key("full", file_path) if self.similarity_index is None else None
+        if cache_key:
+            cached_hash = self.digest_cache.get(cache_key)
+            if cached_hash:
+                if self._keep_digests():
+                    self.file_digests[file_path] = cached_hash
+                return cached_hash
+
         try:
             file_hash = hashlib.blake2b()
+            # Фрагменты для поиска похожих файлов считаются в том же проходе чтения
+            chunker = ContentChunker(self.config) if self.similarity_index is not None else None
             with open(file_path, "rb") as f:
                 while True:
-                    chunk = f.read(self.config.BYTES_TO_SCAN)
+                    if self.budget_check and self.budget_check():
+                        raise ScanBudgetExhausted(file_path)
+                    chunk = self._read(f, self.config.BYTES_TO_SCAN)
                     if not chunk:
                         break
                     file_hash.update(chunk)
+                    if chunker:
+                        chunker.update(chunk)
                     self.progress.add_scanned_bytes(len(chunk))
+            if chunker:
+                self.similarity_index.add(file_path, file_hash.hexdigest(), chunker.finish())
+            if self._keep_digests():
+                self.file_digests[file_path] = file_hash.hexdigest()
+            if cache_key:
+                self.digest_cache.put(cache_key, file_hash.hexdigest())
             return file_hash.hexdigest()
         except (PermissionError, OSError, IOError) as e:
             error_msg = f"Ошибка при вычислении полного хеша {file_path}: {e}"
             self.progress.show_progress(error_msg, False)
             raise
 
+    def calculate_small_file_hashes(self, file_paths: List[str], file_size: int) -> Dict[str, str]:
+        """
+        Вычисляет полные хеши пакета файлов не больше BYTES_TO_SCAN
+
+        Каждый файл читается одним системным вызовом без буферизованного
+        файлового объекта; полученный хеш является окончательным и сохраняется
+        в общем кеше хешей, если он задан.
+
+        Args:
+            file_paths: Пути к файлам одного размера
+            file_size: Размер файлов
+
+        Returns:
+            Словарь файл -> полный хеш для успешно прочитанных файлов
+
+        Raises:
+            ScanBudgetExhausted: Бюджет исчерпан; уже вычисленные хеши передаются в исключении
+        """
+        digests: Dict[str, str] = {}
+        flags = os.O_RDONLY | getattr(os, "O_BINARY", 0)
+        read = self.governor.read if self.governor else os.read
+        blake2b = hashlib.blake2b
+        add_scanned_bytes = self.progress.add_scanned_bytes
+
+        for file_path in file_paths:
+            cache_key = self._cache_key("full", file_path)
+            if cache_key:
+                cached_hash = self.digest_cache.get(cache_key)
+                if cached_hash:
+                    digests[file_path] = cached_hash
+                    continue
+
+            if self.budget_check and self.budget_check():
+                if self._keep_digests():
+                    self.file_digests.update(digests)
+                raise ScanBudgetExhausted(file_path, digests)
+            try:
+                fd = os.open(file_path, flags)
+                try:
+                    # Лишний байт позволяет заметить, что файл вырос после анализа размеров
+                    data = read(fd, file_size + 1)
+                finally:
+                    os.close(fd)
+            except (PermissionError, OSError) as e:
+                self.progress.show_progress(f"Ошибка чтения файла {file_path}: {e}", False)
+                continue
+
+            add_scanned_bytes(len(data))
+            if len(data) != file_size:
+                self.progress.show_progress(f"Размер файла изменился: {file_path}", True)
+                continue
+            digests[file_path] = blake2b(data).hexdigest()
+            if cache_key:
+                self.digest_cache.put(cache_key, digests[file_path])
+
+        if self._keep_digests():
+            self.file_digests.update(digests)
+        return digests
+
     def find_duplicate_by_full_hash(self, snip_file_path: str, current_file_path: str) -> Optional[str]:
         """
         Ищет дубликат по полному хешу файла
@@ -199,6 +767,8 @@ class FileHashCalculator:
             self.full_hashes[current_file_hash] = current_file_path
             return None
 
+        except ScanBudgetExhausted:
+            raise
         except Exception as e:
             self.progress.show_progress(f"Ошибка при поиске дубликата: {e}", False)
             return None
@@ -213,6 +783,13 @@ class FileSizeAnalyzer:
         self.size_to_file: Dict[int, str] = {}  # размер -> первый найденный файл
         self.files_to_process: Dict[str, bool] = {}  # файлы для дальнейшей обработки
         self.files_list: List[str] = []  # список файлов в порядке обхода
+        self.file_sizes: Dict[str, int] = {}  # файл для обработки -> размер
+        self.file_stats: Dict[str, tuple] = {}  # файл -> (размер, mtime_ns, inode)
+        self.keep_stats = False  # Сохранять file_stats и без keep_file_metadata (для кеша хешей)
+        # Для поиска одинаковых директорий: все пройденные директории и записи,
+        # не попавшие в поиск (путь -> 0 для пустого файла, None, если содержимое неизвестно)
+        self.walked_directories: List[str] = []
+        self.other_entries: Dict[str, Optional[int]] = {}
         self.total_files_count = 0
 
     def scan_directory(self, directory_path: str, ignore_list: FileIgnoreList):
@@ -227,11 +804,37 @@ class FileSizeAnalyzer:
         self.size_to_file = {}
         self.files_to_process = {}
         self.files_list = []
+        self.file_sizes = {}
+        self.file_stats = {}
+        self.walked_directories = []
+        self.other_entries = {}
         self.total_files_count = 0
 
+        for file_path, file_size in self.iter_files(directory_path, ignore_list):
+            self._process_file_size(file_path, file_size)
+
+    def iter_files(self, directory_path: str, ignore_list: FileIgnoreList):
+        """
+        Обходит директорию и возвращает непустые неигнорируемые файлы
+
+        Args:
+            directory_path: Путь к директории для сканирования
+            ignore_list: Игнорируемые файлы
+
+        Yields:
+            Пары (путь к файлу, размер файла)
+        """
+        record_tree = self.config.find_duplicate_directories
         try:
-            for root, _, files in sorted(os.walk(directory_path)):
+            for root, dirs, files in sorted(os.walk(directory_path)):
                 files.sort()
+                if record_tree:
+                    self.walked_directories.append(root.rstrip(os.sep) or root)
+                    # os.walk не заходит в ссылки на директории, их содержимое неизвестно
+                    for dir_name in dirs:
+                        if os.path.islink(os.path.join(root, dir_name)):
+                            self.other_entries[os.path.join(root, dir_name)] = None
+
                 for file_name in files:
                     file_path = os.path.join(root, file_name)
                     self.progress.inc_scanned_files()
@@ -239,15 +842,25 @@ class FileSizeAnalyzer:
 
                     try:
                         if ignore_list.is_ignore_file(file_path):
+                            if record_tree:
+                                self.other_entries[file_path] = None
                             continue
 
-                        file_size = os.path.getsize(file_path)
-                        if file_size > 0:  # Игнорируем пустые файлы
-                            self._process_file_size(file_path, file_size)
+                        file_stat = os.stat(file_path)
                     except (FileNotFoundError, OSError) as e:
                         # Возможно, символическая ссылка на несуществующий файл
                         self.progress.show_progress(f"Файл недоступен {file_path}: {e}", True)
+                        if record_tree:
+                            self.other_entries[file_path] = None
                         continue
+
+                    file_size = file_stat.st_size
+                    if file_size > 0:  # Игнорируем пустые файлы
+                        if self.config.keep_file_metadata or self.keep_stats:
+                            self.file_stats[file_path] = (file_size, file_stat.st_mtime_ns, file_stat.st_ino)
+                        yield file_path, file_size
+                    elif record_tree:
+                        self.other_entries[file_path] = 0
         except (PermissionError, OSError) as e:
             error_msg = f"Ошибка доступа к директории {directory_path}: {e}"
             self.progress.show_progress(error_msg, False)
@@ -266,6 +879,8 @@ class FileSizeAnalyzer:
             self.progress.show_progress(
                 f"{file_path} имеет неуникальный размер [{file_size} байт]", False
             )
+            self.file_sizes[file_path] = file_size
+            self.file_sizes[self.size_to_file[file_size]] = file_size
             # Добавляем оригинальный файл в список для обработки
             self._add_original_file_to_process_list(self.size_to_file[file_size])
             # Добавляем текущий файл в список для обработки
@@ -298,6 +913,139 @@ class FileSizeAnalyzer:
         self.progress.show_progress(f"{file_path} добавлен в список для обработки", True)
 
 
+class DirectoryTreeHasher:
+    """Класс поиска одинаковых поддеревьев директорий
+
+    Отпечаток директории вычисляется снизу вверх из имён, размеров и хешей
+    файлов и отпечатков поддиректорий (дерево Меркла), включая пустые файлы
+    и пустые поддиректории. Отпечатки считаются только для директорий, у
+    которых есть пара с тем же общим размером и количеством записей.
+    """
+
+    def __init__(self, config: DuplicateFileFinderConfig, progress: ProgressTracker):
+        self.config = config
+        self.progress = progress
+        self.dir_files: Dict[str, List[str]] = {}  # директория -> файлы в ней
+        self.dir_children: Dict[str, List[str]] = {}  # директория -> поддиректории
+        self.dir_totals: Dict[str, tuple] = {}  # директория -> (общий размер, кол-во записей)
+        self.fingerprints: Dict[str, Optional[str]] = {}
+
+    def find_duplicate_directories(self, root: str, file_sizes: Dict[str, Optional[int]],
+                                   file_digests: Dict[str, str],
+                                   directories: Iterable[str] = ()) -> List[List[str]]:
+        """
+        Ищет группы одинаковых директорий
+
+        Args:
+            root: Корневая директория сканирования
+            file_sizes: Размеры всех пройденных файлов, включая пустые;
+                None — содержимое файла неизвестно (игнорируемый или недоступный)
+            file_digests: Известные полные хеши файлов
+            directories: Все пройденные директории, включая пустые
+
+        Returns:
+            Группы одинаковых директорий; вложенные в уже найденные группы не включаются
+        """
+        self._build_tree(root.rstrip(os.sep) or root, file_sizes, directories)
+
+        buckets: Dict[tuple, List[str]] = {}
+        for directory, totals in self.dir_totals.items():
+            # Деревья из одних пустых файлов и директорий не интересны
+            if totals[0] > 0:
+                buckets.setdefault(totals, []).append(directory)
+
+        groups: Dict[str, List[str]] = {}
+        for directories in buckets.values():
+            if len(directories) < 2:
+                continue
+            for directory in directories:
+                fingerprint = self._fingerprint(directory, file_sizes, file_digests)
+                if fingerprint is not None:
+                    groups.setdefault(fingerprint, []).append(directory)
+
+        group_of = {directory: fingerprint
+                    for fingerprint, group in groups.items() if len(group) > 1 for directory in group}
+        duplicate_groups = []
+        for group in groups.values():
+            if len(group) < 2:
+                continue
+            # Группа следует из родительской, только если каждая её директория
+            # лежит в своей директории одной и той же родительской группы
+            parents = [os.path.dirname(directory) for directory in group]
+            if (all(parent in group_of for parent in parents)
+                    and len({group_of[parent] for parent in parents}) == 1
+                    and len(set(parents)) == len(parents)):
+                continue
+            duplicate_groups.append(sorted(group))
+        return sorted(duplicate_groups)
+
+    def _build_tree(self, root: str, file_sizes: Dict[str, Optional[int]], directories: Iterable[str]):
+        self.dir_files = {}
+        self.dir_children = {}
+        self.dir_totals = {}
+        self.fingerprints = {}
+
+        for directory in directories:
+            self.dir_totals.setdefault(directory, (0, 0))
+            if directory != root:
+                self._add_entry(root, directory, 0)
+
+        for file_path, file_size in file_sizes.items():
+            self.dir_files.setdefault(os.path.dirname(file_path), []).append(file_path)
+            self._add_entry(root, file_path, file_size or 0)
+
+    def _add_entry(self, root: str, path: str, size: int):
+        """Учитывает запись в итогах всех директорий над ней, регистрируя поддиректории"""
+        directory = os.path.dirname(path)
+        node = path
+        while True:
+            if node != path or path in self.dir_totals:
+                children = self.dir_children.setdefault(directory, [])
+                if node not in children:
+                    children.append(node)
+            total_size, entries_count = self.dir_totals.get(directory, (0, 0))
+            self.dir_totals[directory] = (total_size + size, entries_count + 1)
+            parent = os.path.dirname(directory)
+            if directory == root or parent == directory:
+                break
+            node, directory = directory, parent
+
+    def _fingerprint(self, directory: str, file_sizes: Dict[str, int],
+                     file_digests: Dict[str, str]) -> Optional[str]:
+        """
+        Вычисляет отпечаток директории
+
+        Returns:
+            Отпечаток или None, если содержимое хотя бы одного файла неизвестно
+        """
+        if directory in self.fingerprints:
+            return self.fingerprints[directory]
+
+        entries = []
+        fingerprint = None
+        for file_path in self.dir_files.get(directory, []):
+            # У пустых файлов содержимое известно без хеширования
+            digest = "" if file_sizes[file_path] == 0 else file_digests.get(file_path)
+            if digest is None:
+                break
+            entries.append(b"f" + os.fsencode(os.path.basename(file_path)) + b"\0"
+                           + str(file_sizes[file_path]).encode() + b"\0" + digest.encode())
+        else:
+            for child in self.dir_children.get(directory, []):
+                child_fingerprint = self._fingerprint(child, file_sizes, file_digests)
+                if child_fingerprint is None:
+                    break
+                entries.append(b"d" + os.fsencode(os.path.basename(child)) + b"\0" + child_fingerprint.encode())
+            else:
+                tree_hash = hashlib.blake2b()
+                for entry in sorted(entries):
+                    tree_hash.update(entry + b"\n")
+                fingerprint = tree_hash.hexdigest()
+
+        self.fingerprints[directory] = fingerprint
+        return fingerprint
+
+
 class DuplicateHandler:
     """Класс для обработки найденных дубликатов"""
 
@@ -324,8 +1072,22 @@ class DuplicateHandler:
 class OutputManager:
     """Класс для управления выводом"""
 
-    def __init__(self):
-        self.output_buffer = ""
+    def __init__(self, max_chars: Optional[int] = None):
+        # Строки хранятся списком, чтобы добавление не копировало весь буфер;
+        # при заданном max_chars сохраняется только конец вывода
+        self.max_chars = max_chars
+        self._lines = deque()
+        self._chars = 0
+
+    @property
+    def output_buffer(self) -> str:
+        return "".join(self._lines)
+
+    def _append(self, text: str):
+        self._lines.append(text)
+        self._chars += len(text)
+        while self.max_chars is not None and self._chars > self.max_chars and len(self._lines) > 1:
+            self._chars -= len(self._lines.popleft())
 
     def unicode_safe_print(self, text: str):
         """
@@ -336,39 +1098,58 @@ class OutputManager:
         """
         try:
             print(text, flush=True)
-            self.output_buffer += text + "\n"
+            self._append(text + "\n")
         except UnicodeEncodeError:
             try:
                 encoded_text = text.encode("utf8").decode(sys.stdout.encoding)
                 print(encoded_text)
-                self.output_buffer += encoded_text + "\n"
+                self._append(encoded_text + "\n")
             except UnicodeDecodeError:
                 safe_text = (
                         text.encode("utf8").decode(sys.stdout.encoding, errors="ignore")
                         + " <-- Ошибка кодировки Unicode"
                 )
                 print(safe_text)
-                self.output_buffer += safe_text + "\n"
+                self._append(safe_text + "\n")
 
     def get_output(self) -> str:
         """Возвращает накопленный вывод"""
         return self.output_buffer
 
 
-class DuplicateFileFinder:
-    """Основной класс для поиска дубликатов файлов"""
+class ScanSession:
+    """Класс одного сеанса поиска дубликатов
 
-    def __init__(self, _config: Optional[DuplicateFileFinderConfig] = None):
+    Хранит всё состояние сканирования: счётчики прогресса, буфер вывода,
+    промежуточные словари и результаты. Сеансы не разделяют состояние, кроме
+    необязательного общего кеша хешей, поэтому их можно выполнять параллельно.
+    """
+
+    def __init__(self, _config: Optional[DuplicateFileFinderConfig] = None,
+                 ignore_list: Optional[FileIgnoreList] = None,
+                 digest_cache: Optional[DigestCache] = None):
         self.config = _config or DuplicateFileFinderConfig()
-        self.ignore_list = FileIgnoreList()
+        self.ignore_list = ignore_list or FileIgnoreList()
         self.progress = ProgressTracker()
-        self.output_manager = OutputManager()
+        self.output_manager = OutputManager(self.config.OUTPUT_BUFFER_LIMIT)
 
         # Инициализируем компоненты
         self.file_size_analyzer = FileSizeAnalyzer(self.config, self.progress)
         self.hash_calculator = FileHashCalculator(self.config, self.progress)
+        self.hash_calculator.digest_cache = digest_cache
+        self.file_size_analyzer.keep_stats = digest_cache is not None
         self.duplicate_handler = DuplicateHandler(self.config, self.progress)
 
+        # Результаты поиска похожих файлов
+        self.similar_files: List[tuple] = []
+        self.dedup_savings = 0
+
+        # Признак того, что хеширование остановлено по бюджету
+        self.budget_exhausted = False
+
+        # Группы одинаковых директорий
+        self.duplicate_directories: List[List[str]] = []
+
     @staticmethod
     def calculate_total_files(directory_path: str):
         """
@@ -419,16 +1200,40 @@ class DuplicateFileFinder:
         self.progress.reset()
         self.progress.set_total_files(self.calculate_total_files(directory_path))
 
+        # Повторный запуск сеанса не должен видеть хеши предыдущего
+        self.hash_calculator.full_hashes = {}
+        self.hash_calculator.file_digests = {}
+
+        self.hash_calculator.governor = None
+        if IoGovernor.is_enabled(self.config):
+            self.hash_calculator.governor = IoGovernor(self.config, self.progress)
+            if self.config.io_low_priority:
+                self.hash_calculator.governor.lower_priority()
+
         start_time = time.time()
         self.progress.show_progress(f"{time.strftime('%X')} : Начало поиска дубликатов", False)
 
+        self.similar_files = []
+        self.dedup_savings = 0
+        self.hash_calculator.similarity_index = SimilarityIndex(self.config) if self.config.find_similar else None
+
         try:
             # Этап 1: Анализ размеров файлов
             self.file_size_analyzer.scan_directory(directory_path, self.ignore_list)
+            self.hash_calculator.file_stats = self.file_size_analyzer.file_stats
 
             # Этап 2: Поиск дубликатов по хешам
             duplicates = self._find_hash_duplicates()
 
+            # Дополнительный этап: поиск одинаковых директорий
+            self.duplicate_directories = []
+            if self.config.find_duplicate_directories:
+                duplicates = self._find_duplicate_directories(directory_path, duplicates)
+
+            # Дополнительный этап: поиск похожих файлов
+            if self.hash_calculator.similarity_index is not None:
+                self._find_similar_files()
+
             # Этап 3: Вывод статистики
             self._print_summary(self.progress.duples_found, start_time)
 
@@ -439,48 +1244,249 @@ class DuplicateFileFinder:
             self.progress.show_progress(error_msg, False)
             raise
 
+    def _schedule_size_buckets(self) -> List[tuple]:
+        """
+        Группирует файлы по размеру и упорядочивает группы по возможной экономии
+
+        Returns:
+            Список (размер, файлы), начиная с групп с наибольшим размер × (кол-во - 1)
+        """
+        buckets: Dict[int, List[str]] = {}
+        for file_path in self.file_size_analyzer.files_list:
+            buckets.setdefault(self.file_size_analyzer.file_sizes[file_path], []).append(file_path)
+
+        return sorted(buckets.items(), key=lambda item: item[0] * (len(item[1]) - 1), reverse=True)
+
+    def _start_budget(self):
+        """Запоминает начало хеширования и включает проверку бюджета при чтении файлов"""
+        self._budget_start_time = time.time()
+        self._budget_start_bytes = self.progress.megabytes_scanned
+        has_budget = self.config.time_limit is not None or self.config.byte_budget is not None
+        self.hash_calculator.budget_check = self._is_budget_exhausted if has_budget else None
+
+    def _is_budget_exhausted(self) -> bool:
+        """
+        Проверяет, исчерпан ли бюджет времени или объёма чтения
+
+        Returns:
+            True, если продолжать хеширование нельзя
+        """
+        if self.config.time_limit is not None and time.time() - self._budget_start_time >= self.config.time_limit:
+            return True
+        if self.config.byte_budget is not None:
+            bytes_read = (self.progress.megabytes_scanned - self._budget_start_bytes) * self.config.BYTES_IN_A_MEGABYTE
+            return bytes_read >= self.config.byte_budget
+        return False
+
+    def _stop_by_budget(self, duplicates_count: int):
+        """
+        Отмечает остановку хеширования по бюджету
+
+        Args:
+            duplicates_count: Количество дубликатов, найденных до остановки
+        """
+        self.budget_exhausted = True
+        self.progress.show_progress(
+            f"Бюджет сканирования исчерпан, найдено {duplicates_count} дубликатов "
+            f"до остановки", False
+        )
+
     def _find_hash_duplicates(self) -> list:
         """
         Поиск дубликатов по хешам среди файлов с одинаковыми размерами
 
+        Группы размеров обрабатываются в порядке убывания возможной экономии,
+        поэтому при исчерпании бюджета возвращается наиболее ценный частичный результат.
+
         Returns:
-            Количество найденных дубликатов
+            Список пар (оригинал, дубликат)
         """
-        snippet_hashes: Dict[str, str] = {}
-        processed_files = 0
         duplicates_list = []
+        self.budget_exhausted = False
 
-        self.progress.set_megabytes_to_scan(sum([os.path.getsize(f) for f in self.file_size_analyzer.files_list]))
+        self.progress.set_megabytes_to_scan(sum(self.file_size_analyzer.file_sizes.values()))
 
-        for file_path in self.file_size_analyzer.files_list:
-            processed_files += 1
-            self.progress.show_progress(f"Обработка файла {file_path}", True)
+        self._start_budget()
+        try:
+            completed = self._hash_size_buckets(duplicates_list)
+        except ScanBudgetExhausted:
+            # Бюджет исчерпан во время чтения файла
+            completed = False
+        if not completed:
+            self._stop_by_budget(len(duplicates_list))
+        return duplicates_list
+
+    def _hash_size_buckets(self, duplicates_list: list) -> bool:
+        """
+        Хеширует группы размеров по порядку, пока не исчерпан бюджет
+
+        Args:
+            duplicates_list: Список, в который добавляются найденные пары
+
+        Returns:
+            True, если обработаны все группы
+        """
+        for file_size, files in self._schedule_size_buckets():
+            if file_size <= self.config.BYTES_TO_SCAN:
+                # Маленькие файлы читаются целиком, второй этап хеширования не нужен
+                full_hashes: Dict[str, str] = {}
+                for batch_start in range(0, len(files), self.config.SMALL_FILES_BATCH):
+                    if self._is_budget_exhausted():
+                        return False
 
-            # Вычисляем хеш фрагмента файла
-            snippet_hash = self.hash_calculator.calculate_snippet_hash(file_path)
+                    batch = files[batch_start:batch_start + self.config.SMALL_FILES_BATCH]
+                    self.progress.show_progress(f"Обработка {len(batch)} файлов размером {file_size} байт", True)
 
-            # Пропускаем файлы с ошибками
-            if snippet_hash.startswith(("PermissionError:", "IOError:")):
+                    try:
+                        batch_digests = self.hash_calculator.calculate_small_file_hashes(batch, file_size)
+                        exhausted = False
+                    except ScanBudgetExhausted as e:
+                        # Пары из уже прочитанной части пакета тоже попадают в результат
+                        batch_digests, exhausted = e.digests, True
+
+                    for file_path, full_hash in batch_digests.items():
+                        if full_hash in full_hashes:
+                            original_file = full_hashes[full_hash]
+                            duplicates_list.append((original_file, file_path))
+                            self.progress.duples_found += 1
+                            self.duplicate_handler.display_duplicate(original_file, file_path)
+                        else:
+                            full_hashes[full_hash] = file_path
+                    if exhausted:
+                        return False
                 continue
 
-            if snippet_hash in snippet_hashes:
-                # Найден файл с таким же хешем фрагмента
-                original_file = snippet_hashes[snippet_hash]
-                duplicate_file_path = self.hash_calculator.find_duplicate_by_full_hash(original_file, file_path)
+            # Хеши фрагментов сравниваются только внутри группы одного размера
+            snippet_hashes: Dict[str, str] = {}
+
+            for file_path in files:
+                if self._is_budget_exhausted():
+                    return False
+
+                self.progress.show_progress(f"Обработка файла {file_path}", True)
+
+                # Вычисляем хеш фрагмента файла
+                snippet_hash = self.hash_calculator.calculate_snippet_hash(file_path)
+
+                # Пропускаем файлы с ошибками
+                if snippet_hash.startswith(("PermissionError:", "IOError:")):
+                    continue
+
+                if snippet_hash in snippet_hashes:
+                    # Найден файл с таким же хешем фрагмента
+                    original_file = snippet_hashes[snippet_hash]
+                    duplicate_file_path = self.hash_calculator.find_duplicate_by_full_hash(original_file, file_path)
 
-                if duplicate_file_path:
-                    # Найден настоящий дубликат
-                    duplicates_list.append((duplicate_file_path, file_path))
-                    self.progress.duples_found += 1
-                    self.duplicate_handler.display_duplicate(duplicate_file_path, file_path)
+                    if duplicate_file_path:
+                        # Найден настоящий дубликат
+                        duplicates_list.append((duplicate_file_path, file_path))
+                        self.progress.duples_found += 1
+                        self.duplicate_handler.display_duplicate(duplicate_file_path, file_path)
+                    else:
+                        self.progress.show_progress(
+                            "...первые 4096 байт одинаковы, но файлы различаются", True
+                        )
                 else:
-                    self.progress.show_progress(
-                        "...первые 4096 байт одинаковы, но файлы различаются", True
-                    )
-            else:
-                snippet_hashes[snippet_hash] = file_path
+                    snippet_hashes[snippet_hash] = file_path
+        return True
 
-        return duplicates_list
+    def _find_duplicate_directories(self, directory_path: str, duplicates: list) -> list:
+        """
+        Поиск одинаковых директорий по хешам уже найденных дубликатов
+
+        Args:
+            directory_path: Путь к директории сканирования
+            duplicates: Найденные пары дубликатов файлов
+
+        Returns:
+            Пары дубликатов файлов без пар, которые лежат по одному и тому же
+            относительному пути в разных директориях одной группы
+        """
+        analyzer = self.file_size_analyzer
+        file_sizes = {file_path: file_size for file_size, file_path in analyzer.size_to_file.items()}
+        file_sizes.update(analyzer.file_sizes)
+        file_sizes.update(analyzer.other_entries)
+
+        tree_hasher = DirectoryTreeHasher(self.config, self.progress)
+        self.duplicate_directories = tree_hasher.find_duplicate_directories(
+            directory_path, file_sizes, self.hash_calculator.file_digests, analyzer.walked_directories
+        )
+
+        group_of_dir = {directory: group for group in self.duplicate_directories for directory in group}
+
+        def is_implied_by_directories(original_file: str, duplicate_file: str) -> bool:
+            """Следует ли пара из того, что директории одинаковы"""
+            directory = os.path.dirname(original_file)
+            while True:
+                for member in group_of_dir.get(directory, ()):
+                    relative_path = os.path.relpath(original_file, directory)
+                    if member != directory and os.path.join(member, relative_path) == duplicate_file:
+                        return True
+                parent = os.path.dirname(directory)
+                if parent == directory:
+                    return False
+                directory = parent
+
+        for group in self.duplicate_directories:
+            self.progress.show_progress(" Найдены одинаковые директории: \n " + "\n ".join(group) + "\n", False)
+
+        remaining = []
+        for original_file, duplicate_file in duplicates:
+            if is_implied_by_directories(original_file, duplicate_file):
+                self.progress.duples_found -= 1
+                continue
+            remaining.append((original_file, duplicate_file))
+        return remaining
+
+    def _find_similar_files(self):
+        """
+        Поиск похожих файлов по общим фрагментам
+
+        Фрагменты считаются в проходе полного хеширования, но точный поиск читает
+        целиком только файлы с совпавшими фрагментами начала. Остальные файлы
+        (в том числе с уникальным размером) здесь читаются полностью один раз;
+        файлы, полный хеш которых уже вычислен, повторно не читаются.
+        """
+        index = self.hash_calculator.similarity_index
+        all_files = list(self.file_size_analyzer.size_to_file.values()) + self.file_size_analyzer.files_list
+
+        for file_path in dict.fromkeys(all_files):
+            # Дочитывание файлов тоже ограничено бюджетом сканирования
+            if self.budget_exhausted or self._is_budget_exhausted():
+                self.budget_exhausted = True
+                break
+            if file_path in index.file_hashes:
+                continue
+            try:
+                self.hash_calculator.calculate_full_hash(file_path)
+            except ScanBudgetExhausted:
+                self.budget_exhausted = True
+                break
+            except (PermissionError, OSError, IOError):
+                continue
+
+        self.similar_files = index.find_similar_pairs(self.config.similarity_threshold)
+        self.dedup_savings = index.estimate_dedup_savings()
+
+        for file_1, file_2, similarity in self.similar_files:
+            self.progress.show_progress(
+                f" Найдены похожие файлы ({similarity:.0%}): \n {file_1}\n {file_2}\n", False
+            )
+        self.progress.show_progress(
+            f"Блочная дедупликация освободит {self.dedup_savings / self.config.BYTES_IN_A_MEGABYTE:.2f} мегабайт",
+            False
+        )
+
+    def export_results(self, path: str):
+        """
+        Сохраняет метаданные файлов последнего сканирования в колоночный файл
+
+        Args:
+            path: Путь к файлу результатов
+        """
+        if not self.config.keep_file_metadata:
+            raise ValueError("Для экспорта включите config.keep_file_metadata перед сканированием")
+        ScanResultStore.write(path, self.file_size_analyzer.file_stats, self.hash_calculator.file_digests)
 
     def _print_summary(self, duplicate_count: int, start_time: float):
         """
@@ -502,18 +1508,834 @@ class DuplicateFileFinder:
 
         self.progress.show_progress(summary, False)
 
-    def _default_progress_handler(self, message: str, verbose_only: bool):
+    def _default_progress_handler(self, message: str, verbose_only: bool, progress: Optional[ProgressTracker] = None):
         """
         Стандартный обработчик прогресса
 
         Args:
             message: Сообщение для вывода
             verbose_only: Показывать только в подробном режиме
+            progress: Трекер прогресса (не используется)
         """
         if not verbose_only or self.config.verbose_output:
             self.output_manager.unicode_safe_print(message)
 
 
+class DuplicateFileFinder:
+    """Основной класс для поиска дубликатов файлов
+
+    Каждый вызов find_duplicates выполняется в новом сеансе ScanSession, поэтому
+    повторные сканирования не накапливают состояние. Результаты последнего
+    сеанса (progress, similar_files и т.д.) доступны через атрибут session.
+    При параллельных сканированиях каждый поток создаёт свой сеанс через
+    create_session и читает результаты из него.
+    """
+
+    def __init__(self, _config: Optional[DuplicateFileFinderConfig] = None,
+                 digest_cache: Optional[DigestCache] = None):
+        self.config = _config or DuplicateFileFinderConfig()
+        self.ignore_list = FileIgnoreList()
+        self.digest_cache = digest_cache
+        self.session = self.create_session()
+
+    calculate_total_files = staticmethod(ScanSession.calculate_total_files)
+
+    def create_session(self, ignore_list: Optional[FileIgnoreList] = None) -> ScanSession:
+        """
+        Создаёт независимый сеанс сканирования
+
+        Args:
+            ignore_list: Список игнорируемых файлов
+
+        Returns:
+            Новый сеанс с общей конфигурацией и кешем хешей
+        """
+        return ScanSession(self.config, ignore_list or self.ignore_list, self.digest_cache)
+
+    def find_duplicates(self, directory_path: str,
+                        progress_callback: Optional[Callable[[str, bool], None]] = None,
+                        ignore_list: Optional[FileIgnoreList] = None) -> list:
+        """
+        Ищет дубликаты файлов в новом сеансе
+
+        Args:
+            directory_path: Путь к директории для сканирования
+            progress_callback: Функция обратного вызова для отображения прогресса
+            ignore_list: Список игнорируемых файлов
+
+        Returns:
+            Список пар (оригинал, дубликат)
+        """
+        session = self.create_session(ignore_list)
+        self.session = session
+        return session.find_duplicates(directory_path, progress_callback)
+
+
+class DuplicateActionEngine:
+    """Класс пакетной обработки подтверждённых дубликатов
+
+    Поддерживаемые действия: замена жёсткой ссылкой (hardlink), клонирование
+    с копированием при записи (reflink), перемещение в корзину (trash) и
+    удаление (delete). Пара одинаковых директорий обрабатывается пофайлово,
+    после удаления файлов пустые директории копии тоже удаляются. Каждое
+    выполненное действие записывается в журнал, по которому пакет можно
+    отменить. Если журнал не указан, он создаётся в директории корзины.
+    """
+
+    ACTIONS = ("hardlink", "reflink", "trash", "delete")
+    FICLONE = 0x40049409  # ioctl клонирования файла в Linux (btrfs, xfs)
+
+    def __init__(self, config: DuplicateFileFinderConfig, progress: ProgressTracker,
+                 journal_path: Optional[str] = None, dry_run: bool = False):
+        self.config = config
+        self.progress = progress
+        self.journal_path = journal_path or self.default_journal_path(config)
+        self.dry_run = dry_run
+        self.hash_calculator = FileHashCalculator(config, progress)
+
+    @staticmethod
+    def default_journal_path(config: DuplicateFileFinderConfig) -> str:
+        """
+        Возвращает путь к новому журналу в директории корзины
+
+        Args:
+            config: Конфигурация с директорией корзины
+
+        Returns:
+            Путь к файлу журнала, уникальный для пакета
+        """
+        if not config.trash_directory:
+            raise ValueError("Не задана директория корзины для журнала действий")
+        now = time.time_ns()
+        name = time.strftime("journal_%Y%m%d_%H%M%S", time.localtime(now // 10 ** 9))
+        return os.path.join(config.trash_directory, f"{name}_{now % 10 ** 9:09d}.jsonl")
+
+    def execute(self, duplicates: list, action: str) -> List[str]:
+        """
+        Применяет действие ко всем дубликатам пакета
+
+        Args:
+            duplicates: Список пар (оригинал, дубликат) файлов или директорий
+            action: Одно из ACTIONS
+
+        Returns:
+            Список обработанных дубликатов; директория включается,
+            если обработаны все файлы в ней
+        """
+        if action not in self.ACTIONS:
+            raise ValueError(f"Неизвестное действие: {action}")
+        if action == "trash" and not self.config.trash_directory:
+            raise ValueError("Не задана директория корзины")
+
+        file_pairs, directory_files = self._expand_directories(duplicates)
+        snapshots = {path: self._snapshot(path) for pair in file_pairs for path in pair}
+        digests: Dict[str, str] = {}
+        processed = []
+
+        for original_file, duplicate_file in file_pairs:
+            if not self._verify(original_file, duplicate_file, snapshots, digests):
+                continue
+
+            if self.dry_run:
+                self.progress.show_progress(f"[пробный запуск] {action}: {duplicate_file}", False)
+                processed.append(duplicate_file)
+                continue
+
+            entry = {
+                "action": action,
+                "original": os.path.abspath(original_file),
+                "duplicate": os.path.abspath(duplicate_file),
+                "digest": digests[original_file],
+                "mode": snapshots[duplicate_file].st_mode,
+                "atime_ns": snapshots[duplicate_file].st_atime_ns,
+                "mtime_ns": snapshots[duplicate_file].st_mtime_ns,
+            }
+            try:
+                getattr(self, f"_do_{action}")(original_file, duplicate_file, entry)
+            except OSError as e:
+                self.progress.show_progress(f"Ошибка при обработке {duplicate_file}: {e}", False)
+                continue
+
+            self._write_journal(entry)
+            processed.append(duplicate_file)
+            self.progress.show_progress(f"{action}: {duplicate_file}", True)
+
+        processed_files = set(processed)
+        for directory, files in directory_files.items():
+            if not processed_files.issuperset(files):
+                continue
+            if action in ("trash", "delete") and not self.dry_run and not self._remove_empty_tree(directory):
+                continue
+            processed.append(directory)
+
+        return processed
+
+    def undo(self, journal_path: Optional[str] = None) -> List[str]:
+        """
+        Отменяет действия, записанные в журнале, в обратном порядке
+
+        Args:
+            journal_path: Путь к журналу (по умолчанию журнал движка)
+
+        Returns:
+            Список восстановленных файлов
+        """
+        import json
+        import shutil
+
+        with open(journal_path or self.journal_path, "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+        restored = []
+        for entry in reversed(entries):
+            duplicate_file = entry["duplicate"]
+            try:
+                if entry["action"] == "rmdir":
+                    os.makedirs(duplicate_file, exist_ok=True)
+                elif entry["action"] == "trash":
+                    if os.path.lexists(duplicate_file):
+                        raise FileExistsError(f"Файл уже существует: {duplicate_file}")
+                    os.makedirs(os.path.dirname(duplicate_file), exist_ok=True)
+                    # Корзина может быть на другой файловой системе, os.rename там не работает
+                    shutil.move(entry["trash_path"], duplicate_file)
+                elif entry["action"] in ("hardlink", "delete"):
+                    # Содержимое было проверено, поэтому копия восстанавливается из оригинала
+                    if self.hash_calculator.calculate_full_hash(entry["original"]) != entry["digest"]:
+                        raise OSError(f"Оригинал изменён: {entry['original']}")
+                    os.makedirs(os.path.dirname(duplicate_file), exist_ok=True)
+                    self._replace_with_copy(entry["original"], duplicate_file)
+                os.chmod(duplicate_file, entry["mode"] & 0o7777)
+                os.utime(duplicate_file, ns=(entry["atime_ns"], entry["mtime_ns"]))
+            except OSError as e:
+                self.progress.show_progress(f"Не удалось восстановить {duplicate_file}: {e}", False)
+                continue
+            restored.append(duplicate_file)
+        return restored
+
+    def _expand_directories(self, duplicates: list) -> tuple:
+        """
+        Раскрывает пары директорий в пары соответствующих файлов
+
+        Args:
+            duplicates: Список пар (оригинал, дубликат) файлов или директорий
+
+        Returns:
+            (пары файлов, директория-дубликат -> список её файлов)
+        """
+        file_pairs = []
+        directory_files: Dict[str, List[str]] = {}
+        for original, duplicate in duplicates:
+            if not os.path.isdir(duplicate) or os.path.islink(duplicate):
+                file_pairs.append((original, duplicate))
+                continue
+
+            files = directory_files.setdefault(duplicate, [])
+            for root, dirs, names in sorted(os.walk(duplicate)):
+                dirs.sort()
+                relative_root = os.path.relpath(root, duplicate)
+                for name in sorted(names):
+                    duplicate_file = os.path.join(root, name)
+                    file_pairs.append((os.path.normpath(os.path.join(original, relative_root, name)), duplicate_file))
+                    files.append(duplicate_file)
+        return file_pairs, directory_files
+
+    def _remove_empty_tree(self, directory: str) -> bool:
+        """
+        Удаляет опустевшие директории копии снизу вверх, записывая их в журнал
+
+        Returns:
+            True, если директория удалена целиком
+        """
+        for root, _, _ in os.walk(directory, topdown=False):
+            before = self._snapshot(root)
+            try:
+                os.rmdir(root)
+            except OSError as e:
+                self.progress.show_progress(f"Не удалось удалить директорию {root}: {e}", False)
+                return False
+            self._write_journal({
+                "action": "rmdir",
+                "duplicate": os.path.abspath(root),
+                "mode": before.st_mode,
+                "atime_ns": before.st_atime_ns,
+                "mtime_ns": before.st_mtime_ns,
+            })
+        return True
+
+    def _snapshot(self, file_path: str) -> Optional[os.stat_result]:
+        try:
+            return os.stat(file_path)
+        except OSError:
+            return None
+
+    def _verify(self, original_file: str, duplicate_file: str,
+                snapshots: Dict[str, Optional[os.stat_result]], digests: Dict[str, str]) -> bool:
+        """
+        Проверяет непосредственно перед действием, что файлы всё ещё одинаковы
+
+        Сначала сравниваются размер и время изменения с данными на начало пакета,
+        затем полные хеши обоих файлов.
+        """
+        for file_path in (original_file, duplicate_file):
+            before = snapshots[file_path]
+            now = self._snapshot(file_path)
+            if before is None or now is None or (now.st_size, now.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+                self.progress.show_progress(f"Файл изменён или недоступен, пропуск: {file_path}", False)
+                return False
+
+        if os.path.samefile(original_file, duplicate_file):
+            self.progress.show_progress(f"Файлы уже являются одним файлом: {duplicate_file}", True)
+            return False
+
+        try:
+            for file_path in (original_file, duplicate_file):
+                if file_path not in digests:
+                    digests[file_path] = self.hash_calculator.calculate_full_hash(file_path)
+        except OSError:
+            return False
+
+        if digests[original_file] != digests[duplicate_file]:
+            self.progress.show_progress(f"Содержимое различается, пропуск: {duplicate_file}", False)
+            return False
+        return True
+
+    def _do_hardlink(self, original_file: str, duplicate_file: str, entry: dict):
+        tmp_path = duplicate_file + ".dff-tmp"
+        os.link(original_file, tmp_path)
+        os.replace(tmp_path, duplicate_file)
+
+    def _do_reflink(self, original_file: str, duplicate_file: str, entry: dict):
+        import fcntl  # Доступен только в POSIX-системах
+
+        tmp_path = duplicate_file + ".dff-tmp"
+        try:
+            with open(original_file, "rb") as src, open(tmp_path, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), self.FICLONE, src.fileno())
+            os.chmod(tmp_path, entry["mode"] & 0o7777)
+            os.utime(tmp_path, ns=(entry["atime_ns"], entry["mtime_ns"]))
+            os.replace(tmp_path, duplicate_file)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _do_trash(self, original_file: str, duplicate_file: str, entry: dict):
+        import shutil
+
+        os.makedirs(self.config.trash_directory, exist_ok=True)
+        name = os.path.basename(duplicate_file)
+        trash_path = os.path.join(self.config.trash_directory, name)
+        index = 1
+        while os.path.lexists(trash_path):
+            trash_path = os.path.join(self.config.trash_directory, f"{index}_{name}")
+            index += 1
+        shutil.move(duplicate_file, trash_path)
+        entry["trash_path"] = os.path.abspath(trash_path)
+
+    def _do_delete(self, original_file: str, duplicate_file: str, entry: dict):
+        os.remove(duplicate_file)
+
+    @staticmethod
+    def _replace_with_copy(source_file: str, target_file: str):
+        import shutil
+
+        tmp_path = target_file + ".dff-tmp"
+        shutil.copyfile(source_file, tmp_path)
+        os.replace(tmp_path, target_file)
+
+    def _write_journal(self, entry: dict):
+        import json
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class ScanResultStore:
+    """Класс компактного колоночного хранилища результатов сканирования
+
+    Файл состоит из заголовка с таблицей секций и колонок фиксированной ширины
+    (размер, mtime, inode, индекс директории, префикс хеша), а также словарей
+    имён файлов и директорий. При загрузке колонки отображаются через mmap
+    без копирования, поэтому отчёты строятся без обращения к файловой системе.
+    """
+
+    MAGIC = b"DFFSCAN1"
+    DIGEST_SIZE = 16  # Байт хеша, сохраняемых для каждого файла
+    SECTIONS = (("size", "Q"), ("mtime", "q"), ("inode", "Q"), ("dir", "I"), ("digest", "B"),
+                ("name_offsets", "Q"), ("names", "B"), ("dir_offsets", "Q"), ("dirs", "B"))
+    HEADER_FORMAT = "=8s8sQQ" + "QQ" * len(SECTIONS)
+
+    def __init__(self, path: str):
+        import mmap
+        import struct
+
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = struct.unpack_from(self.HEADER_FORMAT, self._mmap)
+        magic, byteorder, self.files_count, self.dirs_count = header[:4]
+        if magic != self.MAGIC or byteorder.rstrip(b"\0").decode() != sys.byteorder:
+            self.close()
+            raise ValueError(f"Неподдерживаемый формат файла результатов: {path}")
+
+        view = memoryview(self._mmap)
+        self.columns: Dict[str, memoryview] = {}
+        for i, (name, fmt) in enumerate(self.SECTIONS):
+            offset, length = header[4 + i * 2], header[5 + i * 2]
+            self.columns[name] = view[offset:offset + length].cast(fmt)
+
+    def close(self):
+        """Освобождает отображение файла в память"""
+        for column in getattr(self, "columns", {}).values():
+            column.release()
+        self.columns = {}
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @classmethod
+    def write(cls, path: str, file_stats: Dict[str, tuple], file_digests: Dict[str, str]):
+        """
+        Записывает результаты сканирования в колоночный файл
+
+        Args:
+            path: Путь к файлу результатов
+            file_stats: Файл -> (размер, mtime_ns, inode)
+            file_digests: Файл -> полный хеш в шестнадцатеричном виде
+        """
+        import struct
+
+        dir_indexes: Dict[str, int] = {}
+        columns = {name: [] for name, _ in cls.SECTIONS}
+        names = bytearray()
+        dirs = bytearray()
+        columns["name_offsets"].append(0)
+        columns["dir_offsets"].append(0)
+        digests = bytearray()
+        empty_digest = bytes(cls.DIGEST_SIZE)
+
+        for file_path, (size, mtime_ns, inode) in file_stats.items():
+            directory, name = os.path.split(file_path)
+            if directory not in dir_indexes:
+                dir_indexes[directory] = len(dir_indexes)
+                dirs += os.fsencode(directory)
+                columns["dir_offsets"].append(len(dirs))
+            names += os.fsencode(name)
+
+            columns["size"].append(size)
+            columns["mtime"].append(mtime_ns)
+            columns["inode"].append(inode)
+            columns["dir"].append(dir_indexes[directory])
+            columns["name_offsets"].append(len(names))
+            digest = file_digests.get(file_path)
+            digests += bytes.fromhex(digest)[:cls.DIGEST_SIZE] if digest else empty_digest
+
+        payloads = []
+        for name, fmt in cls.SECTIONS:
+            if name == "digest":
+                payloads.append(bytes(digests))
+            elif name == "names":
+                payloads.append(bytes(names))
+            elif name == "dirs":
+                payloads.append(bytes(dirs))
+            else:
+                payloads.append(struct.pack(f"={len(columns[name])}{fmt}", *columns[name]))
+
+        # Секции выравниваются по 8 байт, чтобы колонки можно было читать напрямую
+        table = []
+        offset = struct.calcsize(cls.HEADER_FORMAT)
+        for payload in payloads:
+            offset += -offset % 8
+            table += [offset, len(payload)]
+            offset += len(payload)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack(cls.HEADER_FORMAT, cls.MAGIC, sys.byteorder.encode(), len(file_stats), len(dir_indexes), *table))
+            for payload, section_offset in zip(payloads, table[::2]):
+                f.write(bytes(section_offset - f.tell()))
+                f.write(payload)
+        os.replace(tmp_path, path)
+
+    def directory(self, dir_index: int) -> str:
+        """Возвращает путь директории по её индексу"""
+        offsets = self.columns["dir_offsets"]
+        return os.fsdecode(bytes(self.columns["dirs"][offsets[dir_index]:offsets[dir_index + 1]]))
+
+    def file_path(self, index: int) -> str:
+        """Возвращает полный путь файла по его индексу"""
+        offsets = self.columns["name_offsets"]
+        name = os.fsdecode(bytes(self.columns["names"][offsets[index]:offsets[index + 1]]))
+        return os.path.join(self.directory(self.columns["dir"][index]), name)
+
+    def _sorted_groups(self):
+        """
+        Сортирует файлы с известным хешем по (размер, хеш)
+
+        При наличии NumPy колонки читаются через np.frombuffer без копирования
+        и сортируются векторно, иначе сортируются представления колонок.
+
+        Returns:
+            (np или None, порядок индексов, признаки «тот же ключ, что у предыдущего»)
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+
+        if np is not None:
+            sizes = np.frombuffer(self.columns["size"], dtype=np.uint64)
+            digests = np.frombuffer(self.columns["digest"], dtype=np.uint64).reshape(-1, 2)
+            known = np.flatnonzero(digests[:, 0] | digests[:, 1])
+            # lexsort устойчив, поэтому внутри группы файлы остаются в порядке сканирования
+            order = known[np.lexsort((digests[known, 1], digests[known, 0], sizes[known]))]
+            keys = (sizes[order], digests[order, 0], digests[order, 1])
+            same = np.zeros(len(order), dtype=bool)
+            same[1:] = (keys[0][1:] == keys[0][:-1]) & (keys[1][1:] == keys[1][:-1]) & (keys[2][1:] == keys[2][:-1])
+            return np, order, same
+
+        words = self.columns["digest"].cast("B").cast("Q")
+        keys = list(zip(self.columns["size"], words[0::2], words[1::2]))
+        order = [index for index in sorted(range(self.files_count), key=keys.__getitem__) if keys[index][1:] != (0, 0)]
+        sorted_keys = [keys[index] for index in order]
+        same = [False] + list(map(tuple.__eq__, sorted_keys[1:], sorted_keys[:-1]))
+        return None, order, same
+
+    def duplicate_groups(self) -> List[List[int]]:
+        """
+        Группирует файлы с одинаковыми размером и хешем
+
+        Returns:
+            Группы индексов файлов, в каждой не меньше двух файлов
+        """
+        np, order, same = self._sorted_groups()
+        if np is not None:
+            starts = np.flatnonzero(~same)
+            counts = np.diff(np.append(starts, len(order)))
+            return [order[start:start + count].tolist()
+                    for start, count in zip(starts[counts > 1].tolist(), counts[counts > 1].tolist())]
+
+        groups = []
+        for index, is_same in zip(order, same):
+            if is_same:
+                groups[-1].append(index)
+            else:
+                groups.append([index])
+        return [group for group in groups if len(group) > 1]
+
+    def top_groups(self, count: int = 10) -> List[tuple]:
+        """
+        Возвращает группы дубликатов с наибольшим занимаемым лишним местом
+
+        Args:
+            count: Количество групп
+
+        Returns:
+            Список (лишние байты, пути файлов группы)
+        """
+        np, order, same = self._sorted_groups()
+        if np is not None:
+            sizes = np.frombuffer(self.columns["size"], dtype=np.uint64)
+            starts = np.flatnonzero(~same)
+            counts = np.diff(np.append(starts, len(order)))
+            wasted = sizes[order[starts]] * (counts - 1).astype(np.uint64)
+            top = np.argsort(-wasted.astype(np.float64), kind="stable")[:count]
+            top = top[wasted[top] > 0]
+            return [(int(wasted[i]), [self.file_path(index) for index in order[starts[i]:starts[i] + counts[i]].tolist()])
+                    for i in top.tolist()]
+
+        sizes = self.columns["size"]
+        groups = sorted(self.duplicate_groups(), key=lambda group: sizes[group[0]] * (len(group) - 1), reverse=True)
+        return [(sizes[group[0]] * (len(group) - 1), [self.file_path(index) for index in group])
+                for group in groups[:count]]
+
+    def wasted_space_by_directory(self) -> Dict[str, int]:
+        """
+        Подсчитывает место, занятое копиями, по директориям
+
+        Первый файл каждой группы считается оригиналом, остальные — копиями.
+
+        Returns:
+            Словарь директория -> лишние байты, по убыванию
+        """
+        np, order, same = self._sorted_groups()
+        if np is not None:
+            copies = order[same]
+            totals = np.zeros(self.dirs_count, dtype=np.uint64)
+            np.add.at(totals, np.frombuffer(self.columns["dir"], dtype=np.uint32)[copies],
+                      np.frombuffer(self.columns["size"], dtype=np.uint64)[copies])
+            dir_indexes = np.flatnonzero(totals)
+            dir_indexes = dir_indexes[np.argsort(-totals[dir_indexes].astype(np.float64), kind="stable")]
+            return {self.directory(dir_index): int(totals[dir_index]) for dir_index in dir_indexes.tolist()}
+
+        sizes = self.columns["size"]
+        dir_column = self.columns["dir"]
+        wasted: Dict[int, int] = {}
+        for index in (index for index, is_same in zip(order, same) if is_same):
+            wasted[dir_column[index]] = wasted.get(dir_column[index], 0) + sizes[index]
+        return {self.directory(dir_index): total
+                for dir_index, total in sorted(wasted.items(), key=lambda item: (-item[1], item[0]))}
+
+
+class ShardWorker:
+    """Класс узла распределённого сканирования (шарда)
+
+    Шард сканирует своё поддерево и записывает частичный результат в JSON-файл:
+    гистограмму размеров и хеши фрагментов для локально совпадающих размеров.
+    Координатор дописывает в этот же файл запросы, а шард дополняет его ответами.
+    """
+
+    SHARD_FORMAT_VERSION = 1
+
+    def __init__(self, _config: Optional[DuplicateFileFinderConfig] = None,
+                 ignore_list: Optional[FileIgnoreList] = None):
+        self.config = _config or DuplicateFileFinderConfig()
+        self.ignore_list = ignore_list or FileIgnoreList()
+        self.progress = ProgressTracker()
+        self.file_size_analyzer = FileSizeAnalyzer(self.config, self.progress)
+        self.hash_calculator = FileHashCalculator(self.config, self.progress)
+
+        # Ограничения нагрузки на диск действуют и для чтения в шардах
+        if IoGovernor.is_enabled(self.config):
+            self.hash_calculator.governor = IoGovernor(self.config, self.progress)
+            if self.config.io_low_priority:
+                self.hash_calculator.governor.lower_priority()
+
+    def scan(self, directory_path: str, shard_path: str):
+        """
+        Сканирует поддерево и записывает частичный результат шарда
+
+        Args:
+            directory_path: Путь к директории для сканирования
+            shard_path: Путь к файлу шарда
+        """
+        root = os.path.abspath(directory_path)
+        files_by_size: Dict[int, List[str]] = {}
+        for file_path, file_size in self.file_size_analyzer.iter_files(root, self.ignore_list):
+            files_by_size.setdefault(file_size, []).append(file_path)
+
+        shard = {
+            "version": self.SHARD_FORMAT_VERSION,
+            "root": root,
+            "block_size": self.config.BYTES_TO_SCAN,
+            "histogram": {str(size): len(paths) for size, paths in files_by_size.items()},
+            "snippets": {},
+            "full": {},
+            "failed": [],
+        }
+        colliding = [size for size, paths in files_by_size.items() if len(paths) > 1]
+        self._add_snippets(shard, colliding, files_by_size)
+        _write_json(shard_path, shard)
+
+    def answer(self, shard_path: str, request_path: str):
+        """
+        Выполняет запрос координатора и дополняет файл шарда
+
+        Args:
+            shard_path: Путь к файлу шарда
+            request_path: Путь к файлу запроса координатора
+        """
+        shard = _read_json(shard_path)
+        request = _read_json(request_path)
+
+        snippet_sizes = [int(size) for size in request.get("snippet_sizes", [])]
+        if snippet_sizes:
+            wanted = set(snippet_sizes)
+            files_by_size: Dict[int, List[str]] = {}
+            for file_path, file_size in self.file_size_analyzer.iter_files(shard["root"], self.ignore_list):
+                if file_size in wanted:
+                    files_by_size.setdefault(file_size, []).append(file_path)
+            self._add_snippets(shard, snippet_sizes, files_by_size)
+
+        failed = shard.setdefault("failed", [])
+        for file_path in request.get("full_paths", []):
+            if file_path in shard["full"] or file_path in failed:
+                continue
+            try:
+                shard["full"][file_path] = self.hash_calculator.calculate_full_hash(file_path)
+            except (PermissionError, OSError, IOError):
+                # Запоминаем ошибку, чтобы координатор не запрашивал файл повторно
+                failed.append(file_path)
+
+        _write_json(shard_path, shard)
+
+    def _add_snippets(self, shard: dict, sizes: List[int], files_by_size: Dict[int, List[str]]):
+        """
+        Вычисляет хеши фрагментов для файлов указанных размеров
+
+        Args:
+            shard: Данные шарда
+            sizes: Размеры, для которых нужны хеши фрагментов
+            files_by_size: Файлы шарда, сгруппированные по размеру
+        """
+        for size in sizes:
+            digests = shard["snippets"].setdefault(str(size), {})
+            for file_path in files_by_size.get(size, []):
+                snippet_hash = self.hash_calculator.calculate_snippet_hash(file_path)
+                if not snippet_hash.startswith(("PermissionError:", "IOError:")):
+                    digests[file_path] = snippet_hash
+
+
+class ShardCoordinator:
+    """Класс объединения частичных результатов шардов
+
+    Каждый вызов step() читает файлы шардов и либо записывает запросы на
+    недостающие этапы хеширования, либо возвращает итоговый список дубликатов.
+    """
+
+    REQUEST_SUFFIX = ".request.json"
+
+    def __init__(self, shard_paths: List[str]):
+        self.shard_paths = shard_paths
+
+    def step(self) -> Optional[list]:
+        """
+        Выполняет очередной шаг объединения
+
+        Returns:
+            Список пар дубликатов или None, если шардам отправлены запросы
+        """
+        shards = [_read_json(path) for path in self.shard_paths]
+        requests = self.plan(shards)
+
+        pending = False
+        for shard_path, request in zip(self.shard_paths, requests):
+            request_path = shard_path + self.REQUEST_SUFFIX
+            if request["snippet_sizes"] or request["full_paths"]:
+                _write_json(request_path, request)
+                pending = True
+            elif os.path.exists(request_path):
+                os.remove(request_path)
+
+        if pending:
+            return None
+        return self.merge(shards)
+
+    @staticmethod
+    def global_histogram(shards: List[dict]) -> Dict[int, int]:
+        """
+        Суммирует гистограммы размеров всех шардов
+
+        Args:
+            shards: Данные шардов
+
+        Returns:
+            Словарь размер -> количество файлов
+        """
+        histogram: Dict[int, int] = {}
+        for shard in shards:
+            for size, count in shard["histogram"].items():
+                histogram[int(size)] = histogram.get(int(size), 0) + count
+        return histogram
+
+    def plan(self, shards: List[dict]) -> List[dict]:
+        """
+        Определяет недостающие этапы хеширования для каждого шарда
+
+        Args:
+            shards: Данные шардов
+
+        Returns:
+            Запросы к шардам в том же порядке
+        """
+        histogram = self.global_histogram(shards)
+        colliding = {size for size, count in histogram.items() if count > 1}
+
+        requests = [{"snippet_sizes": sorted(size for size in colliding
+                                             if str(size) in shard["histogram"]
+                                             and str(size) not in shard["snippets"]),
+                     "full_paths": []}
+                    for shard in shards]
+        if any(request["snippet_sizes"] for request in requests):
+            return requests
+
+        for group in self._snippet_groups(shards):
+            for shard_index, file_path, size in group:
+                shard = shards[shard_index]
+                if size > shard["block_size"] and file_path not in shard["full"] \
+                        and file_path not in shard.get("failed", []):
+                    requests[shard_index]["full_paths"].append(file_path)
+        return requests
+
+    def merge(self, shards: List[dict]) -> list:
+        """
+        Формирует список дубликатов по полным хешам всех шардов
+
+        Args:
+            shards: Данные шардов
+
+        Returns:
+            Список пар (оригинал, дубликат)
+        """
+        duplicates_list = []
+        for group in self._snippet_groups(shards):
+            full_hashes: Dict[str, str] = {}
+            for shard_index, file_path, size in group:
+                shard = shards[shard_index]
+                if size <= shard["block_size"]:
+                    # Файл прочитан целиком, хеш фрагмента является полным хешем
+                    file_hash = shard["snippets"][str(size)][file_path]
+                else:
+                    file_hash = shard["full"].get(file_path)
+                    if file_hash is None:
+                        continue
+                if file_hash in full_hashes:
+                    duplicates_list.append((full_hashes[file_hash], file_path))
+                else:
+                    full_hashes[file_hash] = file_path
+        return duplicates_list
+
+    @staticmethod
+    def _snippet_groups(shards: List[dict]) -> List[list]:
+        """
+        Группирует файлы всех шардов по размеру и хешу фрагмента
+
+        Args:
+            shards: Данные шардов
+
+        Returns:
+            Группы из двух и более файлов вида (индекс шарда, путь, размер)
+        """
+        groups: Dict[tuple, list] = {}
+        seen_paths = set()
+        for shard_index, shard in enumerate(shards):
+            failed = set(shard.get("failed", []))
+            for size, digests in sorted(shard["snippets"].items(), key=lambda item: int(item[0])):
+                for file_path, snippet_hash in digests.items():
+                    # Файл из пересекающихся корней шардов учитывается один раз
+                    path_key = os.path.normcase(file_path)
+                    if file_path in failed or path_key in seen_paths:
+                        continue
+                    seen_paths.add(path_key)
+                    groups.setdefault((int(size), snippet_hash), []).append((shard_index, file_path, int(size)))
+        return [group for group in groups.values() if len(group) > 1]
+
+
+def _read_json(path: str) -> dict:
+    import json
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: dict):
+    import json
+
+    # Пишем во временный файл, чтобы другой процесс не прочитал файл частично
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
 def get_md5_hash(file_path):
     """
     Calculates the MD5 hash of a given file.
@@ -532,18 +2354,131 @@ def get_md5_hash(file_path):
         return f"An error occurred: {e}"
 
 
-# Пример использования
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Поиск дубликатов файлов")
+    parser.add_argument("-v", "--verbose", action="store_true", help="подробный вывод")
+    parser.add_argument("--time-limit", type=float, metavar="SECONDS",
+                        help="ограничение времени хеширования")
+    parser.add_argument("--byte-budget", type=int, metavar="BYTES",
+                        help="ограничение объёма чтения при хешировании")
+    parser.add_argument("--io-limit", type=int, metavar="BYTES",
+                        help="ограничение скорости чтения, байт в секунду")
+    parser.add_argument("--iops-limit", type=int, metavar="OPS",
+                        help="ограничение количества операций чтения в секунду")
+    parser.add_argument("--low-priority", action="store_true", help="понизить приоритет процесса")
+    parser.add_argument("--adaptive-io", action="store_true",
+                        help="снижать скорость чтения при росте задержки диска")
+    parser.add_argument("--directories", action="store_true", help="искать одинаковые директории")
+    parser.add_argument("--similar", type=float, metavar="THRESHOLD",
+                        help="искать похожие файлы с долей общих данных не ниже THRESHOLD")
+    commands = parser.add_subparsers(dest="command")
+
+    scan_parser = commands.add_parser("scan", help="поиск дубликатов в директории")
+    scan_parser.add_argument("directory", nargs="?", default="C:\\temp")
+    scan_parser.add_argument("--action", choices=DuplicateActionEngine.ACTIONS,
+                             help="действие над найденными дубликатами")
+    scan_parser.add_argument("--dry-run", action="store_true", help="только показать действия")
+    scan_parser.add_argument("--journal", help="журнал для отмены действий (по умолчанию в директории корзины)")
+    scan_parser.add_argument("--export", help="сохранить результаты в колоночный файл")
+
+    report_parser = commands.add_parser("report", help="отчёт по сохранённым результатам")
+    report_parser.add_argument("results_file")
+    report_parser.add_argument("--top", type=int, default=10, help="количество групп в отчёте")
+
+    undo_parser = commands.add_parser("undo", help="отмена действий по журналу")
+    undo_parser.add_argument("journal")
+
+    shard_scan_parser = commands.add_parser("shard-scan", help="сканирование поддерева шардом")
+    shard_scan_parser.add_argument("directory")
+    shard_scan_parser.add_argument("shard_file")
+
+    shard_answer_parser = commands.add_parser("shard-answer", help="ответ шарда на запрос координатора")
+    shard_answer_parser.add_argument("shard_file")
+    shard_answer_parser.add_argument("request_file", nargs="?")
+
+    shard_merge_parser = commands.add_parser("shard-merge", help="объединение результатов шардов")
+    shard_merge_parser.add_argument("shard_files", nargs="+")
+
+    args = parser.parse_args(argv)
+
     # Создаем конфигурацию
     config = DuplicateFileFinderConfig()
-    config.verbose_output = True
-
-    # Создаем экземпляр поисковика
+    config.verbose_output = args.verbose or args.command is None
+    config.time_limit = args.time_limit
+    config.find_duplicate_directories = args.directories
+    config.io_max_bytes_per_second = args.io_limit
+    config.io_max_ops_per_second = args.iops_limit
+    config.io_low_priority = args.low_priority
+    config.io_latency_backoff = args.adaptive_io
+    config.byte_budget = args.byte_budget
+    if args.similar is not None:
+        config.find_similar = True
+        config.similarity_threshold = args.similar
+
+    if args.command == "shard-scan":
+        ShardWorker(config).scan(args.directory, args.shard_file)
+        return 0
+
+    if args.command == "shard-answer":
+        request_file = args.request_file or args.shard_file + ShardCoordinator.REQUEST_SUFFIX
+        if os.path.exists(request_file):
+            ShardWorker(config).answer(args.shard_file, request_file)
+        return 0
+
+    if args.command == "shard-merge":
+        duplicates = ShardCoordinator(args.shard_files).step()
+        if duplicates is None:
+            print("Шардам отправлены запросы, повторите объединение после ответа")
+            return 2
+        for original_file, duplicate_file in duplicates:
+            print(f"{duplicate_file}\t{original_file}")
+        return 0
+
+    if args.command == "report":
+        with ScanResultStore(args.results_file) as results:
+            print("Лишнее место по директориям:")
+            for directory, wasted in list(results.wasted_space_by_directory().items())[:args.top]:
+                print(f"{wasted / config.BYTES_IN_A_MEGABYTE:10.2f} мб  {directory}")
+            print("Крупнейшие группы дубликатов:")
+            for wasted, paths in results.top_groups(args.top):
+                print(f"{wasted / config.BYTES_IN_A_MEGABYTE:10.2f} мб  " + "  ".join(paths))
+        return 0
+
+    config.keep_file_metadata = bool(getattr(args, "export", None))
+
+    # Создаем экземпляр поисковика и сеанс сканирования, из которого читаются результаты
     finder = DuplicateFileFinder(config)
+    session = finder.create_session()
+
+    if args.command == "undo":
+        restored = DuplicateActionEngine(config, session.progress).undo(args.journal)
+        print(f"Восстановлено файлов: {len(restored)}")
+        return 0
 
     # Запускаем поиск
     try:
-        result = finder.find_duplicates("C:\\temp")  # Замените на нужную директорию
+        duplicates = session.find_duplicates(getattr(args, "directory", "C:\\temp"))  # Замените на нужную директорию
         print("Поиск завершен успешно")
+
+        if getattr(args, "export", None):
+            session.export_results(args.export)
+
+        if getattr(args, "action", None):
+            engine = DuplicateActionEngine(config, session.progress, args.journal, args.dry_run)
+            # Файлы внутри одинаковых директорий исключены из пар и обрабатываются вместе с директорией
+            directory_pairs = [(group[0], directory)
+                               for group in session.duplicate_directories for directory in group[1:]]
+            processed = engine.execute(directory_pairs + duplicates, args.action)
+            print(f"Обработано дубликатов: {len(processed)}")
+            if processed and not args.dry_run:
+                print(f"Журнал для отмены: {engine.journal_path}")
     except Exception as e:
         print(f"Ошибка при поиске дубликатов: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import errno
+import os
+import shutil
+
+import pytest
+
+from dff import DuplicateActionEngine, DuplicateFileFinderConfig, ProgressTracker
+
+CONTENT = os.urandom(10000)
+
+
+@pytest.fixture
+def config(tmp_path):
+    config = DuplicateFileFinderConfig()
+    config.trash_directory = str(tmp_path / "trash")
+    return config
+
+
+@pytest.fixture
+def messages():
+    return []
+
+
+@pytest.fixture
+def progress(messages):
+    progress = ProgressTracker()
+    progress.set_progress_callback(lambda message, verbose_only, tracker: messages.append(message))
+    return progress
+
+
+@pytest.fixture
+def pair(tmp_path):
+    original = tmp_path / "original.bin"
+    duplicate = tmp_path / "copy" / "duplicate.bin"
+    duplicate.parent.mkdir()
+    original.write_bytes(CONTENT)
+    duplicate.write_bytes(CONTENT)
+    os.utime(duplicate, ns=(1_000_000_000, 2_000_000_000))
+    return str(original), str(duplicate)
+
+
+def make_engine(config, progress, tmp_path, **kwargs):
+    return DuplicateActionEngine(config, progress, str(tmp_path / "journal.jsonl"), **kwargs)
+
+
+def assert_restored(duplicate):
+    with open(duplicate, "rb") as f:
+        assert f.read() == CONTENT
+    assert os.stat(duplicate).st_mtime_ns == 2_000_000_000
+
+
+def test_hardlink_and_undo(config, progress, tmp_path, pair):
+    original, duplicate = pair
+    engine = make_engine(config, progress, tmp_path)
+
+    assert engine.execute([pair], "hardlink") == [duplicate]
+    assert os.path.samefile(original, duplicate)
+
+    assert engine.undo() == [os.path.abspath(duplicate)]
+    assert not os.path.samefile(original, duplicate)
+    assert_restored(duplicate)
+
+
+def test_trash_and_undo(config, progress, tmp_path, pair):
+    original, duplicate = pair
+    engine = make_engine(config, progress, tmp_path)
+
+    assert engine.execute([pair], "trash") == [duplicate]
+    assert not os.path.exists(duplicate)
+    assert os.listdir(config.trash_directory) == ["duplicate.bin"]
+
+    assert engine.undo() == [os.path.abspath(duplicate)]
+    assert os.listdir(config.trash_directory) == []
+    assert_restored(duplicate)
+
+
+def test_trash_and_undo_across_filesystems(config, progress, tmp_path, pair, monkeypatch):
+    original, duplicate = pair
+    rename = os.rename
+
+    def cross_device_rename(source, target, *args, **kwargs):
+        # Корзина на другой файловой системе: переименование невозможно
+        if config.trash_directory in (os.path.dirname(source), os.path.dirname(target)):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return rename(source, target, *args, **kwargs)
+
+    monkeypatch.setattr(os, "rename", cross_device_rename)
+    engine = make_engine(config, progress, tmp_path)
+
+    assert engine.execute([pair], "trash") == [duplicate]
+    assert not os.path.exists(duplicate)
+
+    assert engine.undo() == [os.path.abspath(duplicate)]
+    assert os.listdir(config.trash_directory) == []
+    assert_restored(duplicate)
+
+
+def test_delete_and_undo(config, progress, tmp_path, pair):
+    original, duplicate = pair
+    engine = make_engine(config, progress, tmp_path)
+
+    assert engine.execute([pair], "delete") == [duplicate]
+    assert not os.path.exists(duplicate)
+
+    assert engine.undo() == [os.path.abspath(duplicate)]
+    assert_restored(duplicate)
+
+
+def test_reflink_and_undo(config, progress, tmp_path, pair, messages):
+    original, duplicate = pair
+    engine = make_engine(config, progress, tmp_path)
+
+    processed = engine.execute([pair], "reflink")
+    if not processed:
+        # Файловая система не поддерживает клонирование: файл не должен пострадать
+        assert any("Ошибка при обработке" in message for message in messages)
+        assert_restored(duplicate)
+        assert not os.path.exists(duplicate + ".dff-tmp")
+        return
+
+    assert not os.path.samefile(original, duplicate)
+    assert engine.undo() == [os.path.abspath(duplicate)]
+    assert_restored(duplicate)
+
+
+def test_undo_delete_refuses_changed_original(config, progress, tmp_path, pair):
+    original, duplicate = pair
+    engine = make_engine(config, progress, tmp_path)
+    engine.execute([pair], "delete")
+
+    with open(original, "wb") as f:
+        f.write(b"changed")
+
+    assert engine.undo() == []
+    assert not os.path.exists(duplicate)
+
+
+def test_dry_run_changes_nothing(config, progress, tmp_path, pair, messages):
+    original, duplicate = pair
+    engine = make_engine(config, progress, tmp_path, dry_run=True)
+
+    for action in ("hardlink", "trash", "delete"):
+        assert engine.execute([pair], action) == [duplicate]
+
+    assert_restored(duplicate)
+    assert not os.path.samefile(original, duplicate)
+    assert not os.path.exists(engine.journal_path)
+    assert not os.path.exists(config.trash_directory)
+    assert any("пробный запуск" in message for message in messages)
+
+
+def test_skips_different_content(config, progress, tmp_path, pair, messages):
+    original, duplicate = pair
+    with open(duplicate, "r+b") as f:
+        f.write(b"X")
+    engine = make_engine(config, progress, tmp_path)
+
+    assert engine.execute([pair], "delete") == []
+    assert os.path.exists(duplicate)
+    assert any("Содержимое различается" in message for message in messages)
+    assert not os.path.exists(engine.journal_path)
+
+
+def test_skips_file_changed_during_batch(config, progress, tmp_path, pair, messages):
+    original, duplicate = pair
+    engine = make_engine(config, progress, tmp_path)
+    snapshot = engine._snapshot
+
+    def snapshot_then_touch(file_path):
+        # Файл меняется сразу после того, как пакет запомнил его состояние
+        result = snapshot(file_path)
+        if file_path == duplicate and not hasattr(snapshot_then_touch, "done"):
+            snapshot_then_touch.done = True
+            os.utime(duplicate, ns=(1_000_000_000, 3_000_000_000))
+        return result
+
+    engine._snapshot = snapshot_then_touch
+
+    assert engine.execute([pair], "delete") == []
+    assert os.path.exists(duplicate)
+    assert any("Файл изменён или недоступен" in message for message in messages)
+
+
+def test_skips_missing_and_already_linked_files(config, progress, tmp_path, pair):
+    original, duplicate = pair
+    engine = make_engine(config, progress, tmp_path)
+
+    assert engine.execute([(original, str(tmp_path / "missing.bin"))], "delete") == []
+
+    os.remove(duplicate)
+    os.link(original, duplicate)
+    assert engine.execute([pair], "hardlink") == []
+
+
+@pytest.fixture
+def directory_pair(tmp_path):
+    original = tmp_path / "original_dir"
+    (original / "sub").mkdir(parents=True)
+    (original / "empty_dir").mkdir()
+    (original / "file.bin").write_bytes(CONTENT)
+    (original / "sub" / "nested.bin").write_bytes(CONTENT[:100])
+    (original / "empty.txt").write_bytes(b"")
+    duplicate = tmp_path / "copy_dir"
+    shutil.copytree(original, duplicate)
+    return str(original), str(duplicate)
+
+
+def tree(directory):
+    return sorted(os.path.relpath(os.path.join(root, name), directory)
+                  for root, dirs, files in os.walk(directory) for name in dirs + files)
+
+
+def test_delete_directory_and_undo(config, progress, tmp_path, directory_pair):
+    original, duplicate = directory_pair
+    engine = make_engine(config, progress, tmp_path)
+
+    processed = engine.execute([directory_pair], "delete")
+    assert processed[-1] == duplicate
+    assert len(processed) == 4
+    assert not os.path.exists(duplicate)
+
+    engine.undo()
+    assert tree(duplicate) == tree(original)
+    with open(os.path.join(duplicate, "sub", "nested.bin"), "rb") as f:
+        assert f.read() == CONTENT[:100]
+
+
+def test_hardlink_directory(config, progress, tmp_path, directory_pair):
+    original, duplicate = directory_pair
+    engine = make_engine(config, progress, tmp_path)
+
+    assert engine.execute([directory_pair], "hardlink")[-1] == duplicate
+    assert os.path.samefile(os.path.join(original, "file.bin"), os.path.join(duplicate, "file.bin"))
+    assert os.path.isdir(os.path.join(duplicate, "empty_dir"))
+
+
+def test_directory_with_changed_file_is_kept(config, progress, tmp_path, directory_pair):
+    original, duplicate = directory_pair
+    with open(os.path.join(duplicate, "sub", "nested.bin"), "wb") as f:
+        f.write(b"changed")
+    engine = make_engine(config, progress, tmp_path)
+
+    processed = engine.execute([directory_pair], "trash")
+    assert duplicate not in processed
+    assert tree(duplicate) == ["empty_dir", "sub", os.path.join("sub", "nested.bin")]
+
+
+def test_default_journal_in_trash_directory(config, progress, pair):
+    original, duplicate = pair
+    engine = DuplicateActionEngine(config, progress)
+    assert os.path.dirname(engine.journal_path) == config.trash_directory
+
+    engine.execute([pair], "delete")
+    assert os.path.exists(engine.journal_path)
+    assert engine.undo() == [os.path.abspath(duplicate)]
+
+
+def test_unknown_action(config, progress, tmp_path, pair):
+    with pytest.raises(ValueError):
+        make_engine(config, progress, tmp_path).execute([pair], "shred")
@@ -0,0 +1,52 @@
+import os
+
+from dff import DigestCache, DuplicateFileFinder
+
+SMALL_CONTENT = b"small file" * 10
+LARGE_CONTENT = b"large file" * 2000
+
+
+def scan_twice(directory):
+    cache = DigestCache()
+    results = []
+    for _ in range(2):
+        finder = DuplicateFileFinder(digest_cache=cache)
+        results.append(finder.find_duplicates(str(directory), lambda message, verbose_only, progress: None))
+    return cache, results
+
+
+def test_small_files_reuse_cache_across_sessions(tmp_path):
+    for i in range(200):
+        (tmp_path / f"file_{i:03}.txt").write_bytes(SMALL_CONTENT)
+
+    cache, (first, second) = scan_twice(tmp_path)
+
+    assert len(first) == 199
+    assert second == first
+    assert cache.misses == 200
+    assert cache.hits == 200
+
+
+def test_large_files_reuse_cache_across_sessions(tmp_path):
+    for i in range(3):
+        (tmp_path / f"file_{i}.bin").write_bytes(LARGE_CONTENT)
+
+    cache, (first, second) = scan_twice(tmp_path)
+
+    assert len(first) == 2
+    assert second == first
+    assert cache.hits == cache.misses > 0
+
+
+def test_changed_file_is_hashed_again(tmp_path):
+    for i in range(2):
+        (tmp_path / f"file_{i}.txt").write_bytes(SMALL_CONTENT)
+    cache = DigestCache()
+    DuplicateFileFinder(digest_cache=cache).find_duplicates(str(tmp_path), lambda *args: None)
+
+    (tmp_path / "file_1.txt").write_bytes(SMALL_CONTENT.upper())
+    # Время изменения гарантированно отличается даже на ФС с грубыми отметками времени
+    os.utime(tmp_path / "file_1.txt", ns=(1_000_000_000, 1_000_000_000))
+    duplicates = DuplicateFileFinder(digest_cache=cache).find_duplicates(str(tmp_path), lambda *args: None)
+
+    assert duplicates == []
@@ -0,0 +1,52 @@
+import os
+import shutil
+
+from dff import DuplicateFileFinder, DuplicateFileFinderConfig
+
+CONTENT = os.urandom(5000)
+
+
+def find(directory):
+    config = DuplicateFileFinderConfig()
+    config.find_duplicate_directories = True
+    finder = DuplicateFileFinder(config)
+    duplicates = finder.find_duplicates(str(directory), lambda message, verbose_only, progress: None)
+    return finder.session.duplicate_directories, duplicates
+
+
+def test_copied_tree_hides_only_implied_pairs(tmp_path):
+    (tmp_path / "A").mkdir()
+    (tmp_path / "A" / "one.bin").write_bytes(CONTENT)
+    (tmp_path / "A" / "two.bin").write_bytes(CONTENT)
+    shutil.copytree(tmp_path / "A", tmp_path / "B")
+
+    directories, duplicates = find(tmp_path)
+
+    assert directories == [[str(tmp_path / "A"), str(tmp_path / "B")]]
+    # Копия внутри оставляемой директории должна остаться в результатах
+    assert (str(tmp_path / "A" / "one.bin"), str(tmp_path / "A" / "two.bin")) in duplicates
+    assert (str(tmp_path / "A" / "one.bin"), str(tmp_path / "B" / "one.bin")) not in duplicates
+
+
+def test_sibling_group_inside_matched_parent_is_kept(tmp_path):
+    for name in ("x", "y"):
+        (tmp_path / "P" / name).mkdir(parents=True)
+        (tmp_path / "P" / name / "data.bin").write_bytes(CONTENT)
+    shutil.copytree(tmp_path / "P", tmp_path / "Q")
+
+    directories, _ = find(tmp_path)
+
+    assert [str(tmp_path / "P"), str(tmp_path / "Q")] in directories
+    assert [str(tmp_path / parent / name) for parent in ("P", "Q") for name in ("x", "y")] in directories
+
+
+def test_empty_file_breaks_directory_match(tmp_path):
+    for name in ("A", "B"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "data.bin").write_bytes(CONTENT)
+    (tmp_path / "B" / "empty.txt").write_bytes(b"")
+
+    directories, duplicates = find(tmp_path)
+
+    assert directories == []
+    assert duplicates == [(str(tmp_path / "A" / "data.bin"), str(tmp_path / "B" / "data.bin"))]
@@ -0,0 +1,34 @@
+from dff import DuplicateFileFinder, DuplicateFileFinderConfig
+
+CONTENT = b"x" * 1000
+
+
+def scan(directory, byte_budget=None):
+    config = DuplicateFileFinderConfig()
+    config.byte_budget = byte_budget
+    messages = []
+    finder = DuplicateFileFinder(config)
+    duplicates = finder.find_duplicates(str(directory), lambda message, verbose_only, progress: messages.append(message))
+    return finder, duplicates, messages
+
+
+def test_budget_stops_inside_small_file_batch(tmp_path):
+    for i in range(100):
+        (tmp_path / f"file_{i:03}.bin").write_bytes(CONTENT)
+
+    finder, duplicates, messages = scan(tmp_path, byte_budget=10_000)
+
+    assert finder.session.budget_exhausted
+    assert any("Бюджет сканирования исчерпан" in message for message in messages)
+    # Прочитано ровно 10 файлов, пары из них не теряются
+    assert len(duplicates) == 9
+
+
+def test_no_budget_finds_everything(tmp_path):
+    for i in range(100):
+        (tmp_path / f"file_{i:03}.bin").write_bytes(CONTENT)
+
+    finder, duplicates, _ = scan(tmp_path)
+
+    assert not finder.session.budget_exhausted
+    assert len(duplicates) == 99
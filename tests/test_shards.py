@@ -0,0 +1,82 @@
+import json
+import os
+
+from dff import DuplicateFileFinderConfig, ShardCoordinator, ShardWorker
+
+LARGE = os.urandom(20000)
+SMALL = b"small" * 100
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def run_shards(roots, shard_dir, before_answer=None, max_rounds=5):
+    """Прогоняет протокол шардов до итогового списка дубликатов"""
+    shard_paths = [str(shard_dir / f"shard_{i}.json") for i in range(len(roots))]
+    for root, shard_path in zip(roots, shard_paths):
+        ShardWorker().scan(str(root), shard_path)
+
+    coordinator = ShardCoordinator(shard_paths)
+    for round_index in range(max_rounds):
+        duplicates = coordinator.step()
+        if duplicates is not None:
+            return duplicates, round_index
+        if before_answer:
+            before_answer(round_index)
+        for shard_path in shard_paths:
+            request_path = shard_path + ShardCoordinator.REQUEST_SUFFIX
+            if os.path.exists(request_path):
+                ShardWorker().answer(shard_path, request_path)
+    raise AssertionError("Координатор не завершил объединение")
+
+
+def test_sizes_colliding_only_across_shards(tmp_path):
+    large_1 = write(tmp_path / "one" / "large.bin", LARGE)
+    small_1 = write(tmp_path / "one" / "small.txt", SMALL)
+    large_2 = write(tmp_path / "two" / "large.bin", LARGE)
+    small_2 = write(tmp_path / "two" / "small.txt", SMALL)
+    # Тот же размер и начало, но другой конец: нужен полный хеш
+    write(tmp_path / "three" / "large.bin", LARGE[:-1] + b"\0")
+
+    duplicates, rounds = run_shards([tmp_path / "one", tmp_path / "two", tmp_path / "three"], tmp_path)
+
+    assert sorted(duplicates) == [(large_1, large_2), (small_1, small_2)]
+    # Запрос фрагментов, затем запрос полных хешей
+    assert rounds == 2
+
+
+def test_failed_file_is_not_requested_again(tmp_path):
+    large_1 = write(tmp_path / "one" / "large.bin", LARGE)
+    large_2 = write(tmp_path / "two" / "large.bin", LARGE)
+    missing = write(tmp_path / "two" / "gone.bin", LARGE)
+
+    def remove_before_full_hashes(round_index):
+        if round_index == 1:
+            os.remove(missing)
+
+    duplicates, rounds = run_shards([tmp_path / "one", tmp_path / "two"], tmp_path, remove_before_full_hashes)
+
+    assert duplicates == [(large_1, large_2)]
+    assert rounds == 2
+    with open(tmp_path / "shard_1.json", encoding="utf-8") as f:
+        assert json.load(f)["failed"] == [missing]
+
+
+def test_overlapping_roots_count_files_once(tmp_path):
+    large_1 = write(tmp_path / "data" / "large.bin", LARGE)
+    large_2 = write(tmp_path / "data" / "sub" / "large.bin", LARGE)
+
+    duplicates, _ = run_shards([tmp_path / "data", tmp_path / "data" / "sub"], tmp_path)
+
+    assert duplicates == [(large_1, large_2)]
+
+
+def test_shard_worker_applies_io_limits():
+    config = DuplicateFileFinderConfig()
+    config.io_max_bytes_per_second = 1024 * 1024
+
+    assert ShardWorker(config).hash_calculator.governor is not None
+    assert ShardWorker().hash_calculator.governor is None
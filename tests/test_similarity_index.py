@@ -0,0 +1,27 @@
+from dff import DuplicateFileFinderConfig, SimilarityIndex
+
+CHUNKS = {fingerprint: 4096 for fingerprint in range(1, 41)}
+
+
+def test_identical_files_are_indexed_once():
+    index = SimilarityIndex(DuplicateFileFinderConfig())
+    for i in range(1000):
+        index.add(f"copy_{i}", "same", CHUNKS)
+    index.add("similar", "other", {**CHUNKS, 1000: 4096})
+
+    assert len(index.file_chunks) == 2
+    assert all(len(files) <= 2 for files in index.buckets.values())
+    assert [pair[:2] for pair in index.find_similar_pairs(0.9)] == [("copy_0", "similar")]
+    # Повторяющиеся копии учитываются в оценке дедупликации
+    assert index.estimate_dedup_savings() == 999 * 40 * 4096 + 40 * 4096
+
+
+def test_oversized_bucket_is_skipped():
+    config = DuplicateFileFinderConfig()
+    config.LSH_MAX_BUCKET_SIZE = 3
+    index = SimilarityIndex(config)
+    for i in range(4):
+        # Одинаковые фрагменты при разных полных хешах: все полосы попадают в одну корзину
+        index.add(f"file_{i}", str(i), CHUNKS)
+
+    assert index.find_similar_pairs(0.9) == []
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import ctypes
 import datetime
 import os
 import sys
@@ -8,15 +7,18 @@ from typing import List
 from PySide6.QtCore import QCoreApplication
 from PySide6.QtWidgets import QApplication, QMainWindow, QFileDialog, QFrame, QMessageBox
 
-from design.ui_DuplicateWidget import Ui_Frame
 from design.ui_MainWindow import Ui_MainWindow
-from dff import DuplicateFileFinder, get_md5_hash, FileIgnoreList
+
+# dff и виджет дубликата импортируются при первом использовании,
+# чтобы главное окно появлялось как можно раньше
 
 
 class DuplicateWidget(QFrame):
     detail_template = "Размер файла: {} мб    Дата изменения: {}    Дата создания: {}    MD5 Хэш: {}"
 
     def __init__(self, files, parent=None, abs_path=""):
+        from design.ui_DuplicateWidget import Ui_Frame
+
         self.file_1 = files[0]
         self.file_2 = files[1]
 
@@ -33,6 +35,13 @@ class DuplicateWidget(QFrame):
 
     @staticmethod
     def get_details(file):
+        from dff import get_md5_hash
+
+        if os.path.isdir(file):
+            total_size = sum(os.path.getsize(os.path.join(root, name))
+                             for root, _, files in os.walk(file) for name in files)
+            return round(total_size / (1024 * 1024), 2), "-", "-", "директория"
+
         creation_timestamp = os.path.getctime(file)
         creation_datetime = datetime.datetime.fromtimestamp(creation_timestamp)
         formatted_time_1 = creation_datetime.strftime("%d.%m.%Y %H:%M:%S")
@@ -52,7 +61,8 @@ class MainWindow(QMainWindow):
     def __init__(self):
         super(MainWindow, self).__init__()
 
-        self.DFF = DuplicateFileFinder()
+        self._dff = None
+        self.session = None  # Сеанс последнего сканирования, из него читаются результаты
         self.progress_text = ""
 
         self.ui = Ui_MainWindow()
@@ -69,6 +79,15 @@ class MainWindow(QMainWindow):
 
         self.duplicates: List[DuplicateWidget] = []
 
+    @property
+    def DFF(self):
+        if self._dff is None:
+            from dff import DuplicateFileFinder
+
+            self._dff = DuplicateFileFinder()
+            self._dff.config.find_duplicate_directories = True
+        return self._dff
+
     def insert_progress(self, text, detailed, progress):
         QCoreApplication.processEvents()
         if not detailed or self.ui.detailProgress_checkBox.isChecked():
@@ -96,6 +115,7 @@ class MainWindow(QMainWindow):
             self.ui.path_lineEdit.setText(new_path)
 
     def scan(self):
+        from dff import FileIgnoreList
 
         self.ui.tabWidget.setCurrentIndex(0)
 
@@ -110,9 +130,9 @@ class MainWindow(QMainWindow):
         ignore_list.ignore_cache = self.ui.skipCache_checkBox.isChecked()
         ignore_list.ignore_system = self.ui.skipSystem_checkBox.isChecked()
 
-        duplicates = self.DFF.find_duplicates(self.ui.path_lineEdit.text(),
-                                              lambda t, d, p: self.insert_progress(t, d, p),
-                                              ignore_list)
+        self.session = self.DFF.create_session(ignore_list)
+        duplicates = self.session.find_duplicates(self.ui.path_lineEdit.text(),
+                                                  lambda t, d, p: self.insert_progress(t, d, p))
 
         while self.ui.verticalLayout_5.count():
             item = self.ui.verticalLayout_5.takeAt(0)
@@ -123,6 +143,12 @@ class MainWindow(QMainWindow):
 
         self.duplicates = []
 
+        for group in self.session.duplicate_directories:
+            for directory in group[1:]:
+                wid = DuplicateWidget((group[0], directory), self, self.ui.path_lineEdit.text())
+                self.duplicates.append(wid)
+                self.ui.verticalLayout_5.addWidget(wid)
+
         for dubs in duplicates:
             wid = DuplicateWidget(dubs, self, self.ui.path_lineEdit.text())
             self.duplicates.append(wid)
@@ -135,26 +161,39 @@ class MainWindow(QMainWindow):
         self.ui.tabWidget.setCurrentIndex(1)
 
     def move_to_trash(self):
-        to_delete = []
-        for widget in self.duplicates:
-            if widget.ui.checkBox.isChecked():
-                to_delete.append(widget.file_2)
+        to_delete = [widget for widget in self.duplicates if widget.ui.checkBox.isChecked()]
 
         if QMessageBox.question(self, "Вы уверены?",
                                 f"Вы уверены, что хотите переместить в корзину файлы ({len(to_delete)})?",
                                 QMessageBox.StandardButton.NoButton | QMessageBox.StandardButton.Yes) == QMessageBox.StandardButton.Yes:
-            QMessageBox.warning(self, "Файлы перемещены в корзину", "\n".join(to_delete), QMessageBox.StandardButton.Ok)
+            processed = self.apply_action(to_delete, "trash")
+            QMessageBox.warning(self, "Файлы перемещены в корзину", "\n".join(processed), QMessageBox.StandardButton.Ok)
 
     def delete_files(self):
-        to_delete = []
-        for widget in self.duplicates:
-            if widget.ui.checkBox.isChecked():
-                to_delete.append(widget.file_2)
+        to_delete = [widget for widget in self.duplicates if widget.ui.checkBox.isChecked()]
 
         if QMessageBox.question(self, "Вы уверены?",
                                 f"Вы уверены, что хотите удалить файлы ({len(to_delete)})?",
                                 QMessageBox.StandardButton.NoButton | QMessageBox.StandardButton.Yes) == QMessageBox.StandardButton.Yes:
-            QMessageBox.critical(self, "Файлы удалены", "\n".join(to_delete), QMessageBox.StandardButton.Ok)
+            processed = self.apply_action(to_delete, "delete")
+            QMessageBox.critical(self, "Файлы удалены", "\n".join(processed), QMessageBox.StandardButton.Ok)
+
+    def apply_action(self, widgets, action):
+        from dff import DuplicateActionEngine
+
+        if not widgets:
+            return []
+
+        engine = DuplicateActionEngine(self.DFF.config, self.session.progress)
+        processed = engine.execute([(widget.file_1, widget.file_2) for widget in widgets], action)
+
+        for widget in widgets:
+            if widget.file_2 in processed:
+                self.duplicates.remove(widget)
+                widget.setParent(None)
+                widget.deleteLater()
+
+        return processed
 
 
 def main():
@@ -166,6 +205,8 @@ def main():
 
 
 if __name__ == '__main__':
+    import ctypes
+
     myappid = 'LinkCom.DFF.app.1'
     ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
     main()